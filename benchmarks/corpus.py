@@ -0,0 +1,106 @@
+"""
+Generates synthetic cracked password lists and compare directories for the benchmarks
+"""
+
+import os
+import random
+import string
+
+import numpy as np
+
+WORDS = ['password', 'welcome', 'summer', 'winter', 'fall', 'spring', 'dragon', 'monkey', 'letmein', 'qwerty',
+         'admin', 'football', 'baseball', 'shadow', 'master', 'sunshine', 'princess', 'iloveyou', 'company']
+LEET = str.maketrans({'a': '@', 'e': '3', 'i': '1', 'o': '0', 's': '$'})
+# rows generated and written per block, only the candidate pool is held whole
+WRITE_BLOCK = 1000000
+# longest password gen_password makes, the pool holds candidates as fixed width bytes of this size so the 40M
+# candidates of a 100M row corpus take 640 MB instead of a Python string each
+PASSWORD_WIDTH = 16
+
+
+def gen_password(rng):
+    """
+    Generates one password shaped like a cracked corporate password
+    :param rng: random.Random
+    :return: str
+    """
+    roll = rng.random()
+    if roll < 0.6:
+        word = rng.choice(WORDS)
+        if rng.random() < 0.5:
+            word = word.capitalize()
+        if rng.random() < 0.2:
+            word = word.translate(LEET)
+        return word + str(rng.randint(0, 2025)) + rng.choice(['', '', '!', '@', '#', '$'])
+    if roll < 0.8:
+        return ''.join(rng.choice(string.digits) for _ in range(rng.randint(4, 10)))
+    return ''.join(rng.choice(string.ascii_letters + string.digits + '!@#$%^&*') for _ in range(rng.randint(6, 16)))
+
+
+def gen_pool(size, seed):
+    """
+    Generates candidate passwords, earlier ones are drawn more often
+    :param size: number of candidates
+    :param seed: random seed
+    :return: np.ndarray of bytes
+    """
+    rng = random.Random(seed)
+    pool = np.empty(max(size, 1), dtype=f'S{PASSWORD_WIDTH}')
+    for i in range(0, len(pool), WRITE_BLOCK):
+        pool[i:i + WRITE_BLOCK] = [gen_password(rng).encode('ascii') for _ in range(min(WRITE_BLOCK, len(pool) - i))]
+    return pool
+
+
+def zipf_cdf(size, exponent):
+    """
+    Cumulative Zipf weights, so a few passwords are reused heavily and most appear once or twice
+    :param size: number of candidates
+    :param exponent: Zipf exponent, larger reuses popular passwords more
+    :return: np.ndarray
+    """
+    cdf = np.cumsum(1.0 / np.arange(1, size + 1) ** exponent)
+    return cdf / cdf[-1]
+
+
+def write_sample(path, pool, rows, seed, exponent=0.8):
+    """
+    Writes passwords drawn from a pool with Zipf distributed reuse, one per line
+    :param path: file to write
+    :param pool: np.ndarray of candidate passwords from gen_pool
+    :param rows: number of lines
+    :param seed: random seed
+    :param exponent: Zipf exponent
+    """
+    rng = np.random.default_rng(seed)
+    cdf = zipf_cdf(len(pool), exponent)
+    with open(path, 'wb') as output_file:
+        for i in range(0, rows, WRITE_BLOCK):
+            positions = np.searchsorted(cdf, rng.random(min(WRITE_BLOCK, rows - i)), side='right')
+            output_file.write(b'\n'.join(pool[np.minimum(positions, len(pool) - 1)]) + b'\n')
+
+
+def write_corpus(data_dir, rows, seed=1, distinct_ratio=0.4, exponent=0.8):
+    """
+    Writes a cracked password list and a compare directory next to it unless they already exist
+    :param data_dir: directory to write into
+    :param rows: passwords in the list
+    :param seed: random seed
+    :param distinct_ratio: candidate passwords per row, the list holds fewer since popular ones repeat
+    :param exponent: Zipf exponent of password reuse
+    :return: tuple of list path and compare directory
+    """
+    name = f'corpus-{rows}-{seed}'
+    input_path = os.path.join(data_dir, name + '.txt')
+    compare_dir = os.path.join(data_dir, name + '-compare')
+    if os.path.isfile(input_path) and os.path.isdir(compare_dir):
+        return input_path, compare_dir
+
+    os.makedirs(compare_dir, exist_ok=True)
+    pool = gen_pool(int(rows * distinct_ratio), seed)
+    # a breach list sharing the popular passwords and one with passwords mostly unseen in the list
+    write_sample(os.path.join(compare_dir, 'breach.txt'), pool, rows, seed + 1, exponent)
+    write_sample(os.path.join(compare_dir, 'unrelated.txt'), gen_pool(max(rows // 10, 1), seed + 2), rows, seed + 3,
+                 exponent)
+    write_sample(input_path + '.tmp', pool, rows, seed, exponent)
+    os.replace(input_path + '.tmp', input_path)
+    return input_path, compare_dir
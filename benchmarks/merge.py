@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+Checks that merging the aggregates of many chunks scales near linearly with the number of chunks
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import pwdstat  # noqa: E402
+
+
+def chunk_stats(index, distinct, overlap, rng):
+    """
+    Builds the aggregates of one chunk, a share of its passwords also appear in other chunks
+    :param index: chunk number
+    :param distinct: distinct passwords of the chunk
+    :param overlap: share of passwords drawn from a pool common to all chunks
+    :param rng: np.random.Generator
+    :return: pwdstat.PasswordStats
+    """
+    shared = int(distinct * overlap)
+    passwords = np.concatenate([np.char.add('shared', rng.choice(distinct, shared, replace=False).astype(str)),
+                                np.char.add(f'chunk{index}-', np.arange(distinct - shared).astype(str))])
+    counts = rng.integers(1, 5, len(passwords))
+    df = pd.DataFrame({'Password': passwords.astype(object), 'Count': counts,
+                       'Complexity': rng.integers(1, 5, len(passwords)), 'Length': np.char.str_len(passwords),
+                       'Mask': np.char.add('?l?d', (counts % 50).astype(str)).astype(object)})
+    stats = pwdstat.PasswordStats()
+    stats.classes = stats.sum_by(df.assign(Class='2: okay'), 'Class')
+    stats.masks = stats.sum_by(df, 'Mask')
+    stats.passwords = stats.sum_by(df, 'Password')
+    stats.tokens = pd.Series(counts, index=passwords.astype(object)).groupby(level=0).sum()
+    stats.hits = pd.Series({'Is In breach.txt': int(counts.sum())})
+    stats.examples = df[['Mask', 'Password']].groupby('Mask').head(stats.examples_per_mask)
+    return stats
+
+
+def bench_merge(chunks, distinct, overlap, seed):
+    """
+    Times merging chunk aggregates the way analyze_chunks collects them
+    :param chunks: number of chunks
+    :param distinct: distinct passwords per chunk
+    :param overlap: share of passwords common to all chunks
+    :param seed: random seed
+    :return: seconds
+    """
+    rng = np.random.default_rng(seed)
+    parts = [chunk_stats(i, distinct, overlap, rng) for i in range(chunks)]
+    start = time.perf_counter()
+    stats = pwdstat.PasswordStats()
+    for part in parts:
+        stats.merge(part)
+    stats.aggregate()
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Checks that merging chunk aggregates scales near linearly')
+    parser.add_argument("-n", "--chunks", action="store", type=int, nargs='+', default=[16, 32, 64, 128],
+                        help="Numbers of chunks to merge.")
+    parser.add_argument("-d", "--distinct", action="store", type=int, default=50000,
+                        help="Distinct passwords per chunk.")
+    parser.add_argument("--overlap", action="store", type=float, default=0.2,
+                        help="Share of each chunk drawn from passwords common to all chunks.")
+    parser.add_argument("-s", "--seed", action="store", type=int, default=1, help="Random seed.")
+    parser.add_argument("--max-growth", action="store", type=float, default=2.0,
+                        help="Fails when the time per chunk of the most chunks exceeds this multiple of the fewest.")
+    args = parser.parse_args()
+
+    per_chunk = []
+    for chunks in args.chunks:
+        seconds = bench_merge(chunks, args.distinct, args.overlap, args.seed)
+        per_chunk.append(seconds / chunks)
+        print(f'{chunks} chunks: {seconds:,.2f}s, {per_chunk[-1] * 1000:,.1f}ms per chunk')
+    growth = per_chunk[-1] / per_chunk[0]
+    print(f'time per chunk grew {growth:.2f}x from {args.chunks[0]} to {args.chunks[-1]} chunks')
+    if growth > args.max_growth:
+        sys.exit(f'merging is not near linear, the limit is {args.max_growth:.2f}x')
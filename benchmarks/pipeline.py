@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+"""
+Times each stage of the pwdstat pipeline on synthetic corpora and records peak memory
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import pwdstat  # noqa: E402
+from corpus import write_corpus  # noqa: E402
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def peak_rss_mb(who=None):
+    """
+    Peak resident memory so far
+    :param who: resource.RUSAGE_SELF, or resource.RUSAGE_CHILDREN for the largest finished worker process
+    :return: float or None where the resource module is missing
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF if who is None else who).ru_maxrss
+    # Linux reports kilobytes and macOS bytes
+    return peak / (1 << 20 if sys.platform == 'darwin' else 1 << 10)
+
+
+def bench_run(input_path, compare_dir, config, file_format, use_index):
+    """
+    Runs the pipeline the way the CLI does and reads the time of every stage from its StageProfile
+    :param input_path: password list
+    :param compare_dir: directory of compare lists
+    :param config: pwdstat.AnalyzerConfig
+    :param file_format: output format of the write stage, None skips writing
+    :param use_index: build compare indexes first and probe them instead of the lists
+    :return: dict
+    """
+    result = {'rss_start_mb': peak_rss_mb()}
+    profile = pwdstat.StageProfile()
+    if use_index:
+        with profile.stage('build index'):
+            pwdstat.build_compare_indexes(compare_dir)
+    else:
+        # corpora are kept between runs, indexes left by an earlier --index run would be probed instead of the lists
+        for name in os.listdir(compare_dir):
+            if name.endswith(pwdstat.INDEX_SUFFIX):
+                os.remove(os.path.join(compare_dir, name))
+
+    config.compare_dir = compare_dir
+    start = time.perf_counter()
+    report = pwdstat.analyze(input_path, config, profile=profile)
+    if file_format:
+        with tempfile.TemporaryDirectory() as output_dir:
+            report.write_tables(output_dir, file_format, profile)
+    total = time.perf_counter() - start
+
+    rows = int(profile.stages['collapse'][1]) if 'collapse' in profile.stages else 0
+    result.update({'rows': rows, 'distinct': int(profile.stages['scan'][1]) if 'scan' in profile.stages else 0,
+                   'seconds': total, 'rows_per_sec': rows / total if total else None,
+                   'stages': {name: record[2] for name, record in profile.stages.items()},
+                   'peak_rss_mb': peak_rss_mb(),
+                   'worker_peak_rss_mb': peak_rss_mb(resource.RUSAGE_CHILDREN) if config.workers > 1 and resource
+                   else None})
+    return result
+
+
+def run_child(args):
+    """
+    Benchmarks one corpus in a fresh interpreter so peak memory only covers that run
+    :param args: parsed arguments of the parent
+    :return: dict
+    """
+    command = [sys.executable, os.path.abspath(__file__), '--child', '-n', str(args.child_rows), '-s', str(args.seed),
+               '-d', args.data_dir, '--tokenizer', args.tokenizer, '--format', args.format, '--workers', str(args.workers)]
+    for flag, value in [('--chunksize', args.chunksize), ('--filter', args.filter), ('--index', args.index)]:
+        if value:
+            command += [flag] if value is True else [flag, str(value)]
+    output = subprocess.run(command, check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def print_results(results):
+    """
+    Prints seconds per stage for every corpus size
+    :param results: list of result dicts
+    """
+    stages = list(dict.fromkeys(stage for r in results for stage in r['stages']))
+    table = pd.DataFrame([[r['stages'].get(stage, np.nan) for stage in stages] for r in results],
+                         index=[r['rows'] for r in results], columns=stages).T
+    table.loc['total'] = [r['seconds'] for r in results]
+    table.loc['rows/sec'] = [r['rows_per_sec'] for r in results]
+    table.loc['peak RSS MB'] = [r['peak_rss_mb'] for r in results]
+    if any(r['worker_peak_rss_mb'] for r in results):
+        table.loc['worker peak RSS MB'] = [r['worker_peak_rss_mb'] for r in results]
+    print(table.to_string(float_format=lambda value: f'{value:,.3f}'))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Times each stage of the pwdstat pipeline on synthetic corpora')
+    parser.add_argument("-n", "--rows", action="store", type=int, nargs='+', default=[1000, 10000, 100000, 1000000],
+                        help="Corpus sizes to benchmark, up to 100000000.")
+    parser.add_argument("-s", "--seed", action="store", type=int, default=1, help="Seed of the synthetic corpora.")
+    parser.add_argument("-d", "--data-dir", action="store", default='bench-data',
+                        help="Directory keeping generated corpora between runs.")
+    parser.add_argument("-j", "--json", action="store", default=None, help="Writes results as JSON to this file.")
+    parser.add_argument("--chunksize", action="store", type=int, default=None,
+                        help="Streams each corpus in chunks of this many passwords.")
+    parser.add_argument("--workers", action="store", type=int, default=1,
+                        help="Shards each corpus across this many processes.")
+    parser.add_argument("--tokenizer", action="store", choices=pwdstat.TOKENIZERS, default='fast',
+                        help="Tokenizer backend.")
+    parser.add_argument("--format", action="store", choices=pwdstat.OUTPUT_FORMATS + ['none'], default='tsv',
+                        help="Format of the write stage, none skips it.")
+    parser.add_argument("--filter", action="store_true", default=False, help="Filters subpar passwords.")
+    parser.add_argument("--index", action="store_true", default=False,
+                        help="Builds compare indexes first and probes them.")
+    parser.add_argument("--child", action="store_true", default=False, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    config = pwdstat.AnalyzerConfig(args.filter, chunksize=args.chunksize, workers=args.workers,
+                                    tokenizer=args.tokenizer)
+    if args.child:
+        input_path, compare_dir = write_corpus(args.data_dir, args.rows[0], args.seed)
+        print(json.dumps(bench_run(input_path, compare_dir, config, None if args.format == 'none' else args.format,
+                                   args.index)))
+        exit()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    results = []
+    for rows in args.rows:
+        start = time.perf_counter()
+        input_path, compare_dir = write_corpus(args.data_dir, rows, args.seed)
+        print(f'{rows:,} rows: corpus ready in {time.perf_counter() - start:,.1f}s', file=sys.stderr)
+        args.child_rows = rows
+        results.append(run_child(args))
+    print_results(results)
+
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump({'pwdstat_version': subprocess.run(
+                ['git', 'describe', '--always', '--dirty'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True).stdout.strip(),
+                'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__,
+                'platform': platform.platform(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'options': {'seed': args.seed, 'chunksize': args.chunksize, 'workers': args.workers,
+                            'tokenizer': args.tokenizer, 'format': args.format, 'filter': args.filter,
+                            'index': args.index},
+                'results': results}, json_file, indent=2)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""
+Compares throughput and token output of the pwdstat tokenizer backends
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import pwdstat  # noqa: E402
+from corpus import gen_password  # noqa: E402
+
+# passwords with the leading token the leet tokenizer should find, substitutions in runs, at the start of a word and
+# appended digits or symbols that stay as typed
+LEET_CASES = {'p@$$w0rd': 'password', 'l33t': 'leet', '4dmin': 'admin', '1l0v3y0u': 'iloveyou', 'h4ck3r5': 'hacker',
+              'P@ssw0rd1': 'password', 'Fall2021!': 'fall', 'dragon$': 'dragon', 'admin123': 'admin', '123abc': '123'}
+
+
+def bench_tokenizer(tokenizer, passwords):
+    """
+    Times the leading token of every password with one backend and cold caches
+    :param tokenizer: one of pwdstat.TOKENIZERS
+    :param passwords: list of distinct passwords
+    :return: tuple of seconds and tokens
+    """
+    pwdstat.leading_token.cache_clear()
+    pwdstat.stem_word.cache_clear()
+    analyzer = pwdstat.PasswordAnalyzer(pd.DataFrame({'Password': passwords}), False, tokenizer=tokenizer)
+    start = time.perf_counter()
+    tokens = analyzer.tokenize_leading(passwords)
+    return time.perf_counter() - start, tokens
+
+
+def check_leet():
+    """
+    Tokenizes LEET_CASES with the leet backend
+    :return: dict of the passwords whose leading token differs, mapped to the token found
+    """
+    passwords = list(LEET_CASES)
+    _, tokens = bench_tokenizer('leet', passwords)
+    return {password: token for password, token in zip(passwords, tokens) if token != LEET_CASES[password]}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compares the pwdstat tokenizer backends')
+    parser.add_argument("-n", "--rows", action="store", type=int, default=100000, help="Distinct passwords to tokenize.")
+    parser.add_argument("-s", "--seed", action="store", type=int, default=1, help="Seed of the synthetic passwords.")
+    parser.add_argument("-j", "--json", action="store", default=None, help="Writes results as JSON to this file.")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    passwords = list(dict.fromkeys(gen_password(rng) for _ in range(args.rows)))
+    results = {}
+    for tokenizer in pwdstat.TOKENIZERS:
+        try:
+            seconds, tokens = bench_tokenizer(tokenizer, passwords)
+        except LookupError:
+            print(f'{tokenizer}: skipped, NLTK punkt data is not installed')
+            continue
+        results[tokenizer] = {'seconds': seconds, 'passwords_per_sec': len(passwords) / seconds,
+                              'top_tokens': pd.Series(tokens).value_counts().head(10).to_dict(), 'tokens': tokens}
+
+    for tokenizer, result in results.items():
+        agreement = ''
+        if 'nltk' in results and tokenizer != 'nltk':
+            same = sum(i == j for i, j in zip(results['nltk']['tokens'], result['tokens']))
+            result['nltk_agreement'] = same / len(passwords)
+            agreement = f', {result["nltk_agreement"]:.1%} same leading token as nltk'
+        print(f'{tokenizer}: {result["passwords_per_sec"]:,.0f} passwords/sec{agreement}')
+        print('  top tokens: ' + ', '.join(f'{token} ({count})' for token, count in result['top_tokens'].items()))
+
+    wrong = check_leet()
+    print(f'leet: {len(LEET_CASES) - len(wrong)} of {len(LEET_CASES)} known cases')
+    for password, token in wrong.items():
+        print(f'  {password} gave {token}, expected {LEET_CASES[password]}')
+
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump({'rows': len(passwords), 'seed': args.seed,
+                       'results': {tokenizer: {key: value for key, value in result.items() if key != 'tokens'}
+                                   for tokenizer, result in results.items()},
+                       'leet_wrong': wrong}, json_file, indent=2)
+    if wrong:
+        sys.exit('the leet tokenizer missed known cases')
@@ -1,26 +1,145 @@
 #!/usr/bin/env python
 
 import argparse
+import datetime
+import hashlib
+import io
+import json
 import os
+import re
+import sqlite3
 import sys
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache
 
-import nltk
+import numpy as np
 import pandas as pd
 from colorama import init
-from nltk.stem import PorterStemmer
-from nltk.tokenize import word_tokenize
+
+# sorted password hashes of the compare lists, kept by each process of an analyze_chunks pool for its later chunks
+worker_compare_cache = None
+
+COMPARE_CHUNKSIZE = 1000000
+# compare lists read and probed at once, each holds up to COMPARE_CHUNKSIZE lines in memory
+COMPARE_THREADS = 4
+# masks or tokens held as Python strings at once while masking and tokenizing
+STRING_BLOCK = 100000
+TOKEN_CACHE_SIZE = 1 << 20
+INDEX_SUFFIX = '.pwdidx.npy'
+STATE_VERSION = 2
+ROW_GROUP_SIZE = 1000000
+OUTPUT_FORMATS = ['tsv', 'parquet', 'arrow']
+OUTPUT_EXTENSIONS = {'tsv': '.csv', 'parquet': '.parquet', 'arrow': '.arrow'}
+CLASS_LABELS = ['0: subpar', '1: minimum', '2: okay', '3: good', '4: great', '5: strong']
+CHAR_OTHER, CHAR_DIGIT, CHAR_LOWER, CHAR_UPPER, CHAR_SPECIAL, CHAR_CONT = range(6)
+# Hashcat charset for each character class above
+MASK_CHARSETS = 'adlus'
+# candidates per position of each Hashcat charset
+CHARSET_SIZES = {'a': 95, 'd': 10, 'l': 26, 'u': 26, 's': 33}
+RATE_UNITS = {'': 1, 'k': 1e3, 'M': 1e6, 'G': 1e9, 'T': 1e12}
+DURATION_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}
+TOKENIZERS = ['nltk', 'fast', 'leet']
+# names the rules of each tokenizer in token caches and state files, changed when its tokens change
+TOKENIZER_RULES = {'nltk': 'nltk', 'fast': 'fast', 'leet': 'leet-2'}
+# fast tokenizer splits passwords into runs of letters, digits and symbols
+TOKEN_PATTERN = r'[^\W\d_]+|\d+|[\W_]+'
+# leet tokenizer first reads runs of look-alike digits and symbols as letters inside a word or at its start, a run
+# ending a password stays as typed since it is usually an appended digit or symbol
+LEET_PATTERN = r'(?<=[^\W\d_])[4@310$57]+(?=[^\W\d_])|^[4@310$57]+(?=[^\W\d_])'
+LEET_LETTERS = str.maketrans({'4': 'a', '@': 'a', '3': 'e', '1': 'i', '0': 'o', '$': 's', '5': 's', '7': 't'})
 
 
 def dep_check():
     """
-    Checks if nltk dependencies are installed
+    Checks if nltk dependencies are installed, only needed by the nltk tokenizer
     """
+    word_tokenize, _ = nltk_tools()
     try:
         word_tokenize('can you parse me')
     except LookupError:
+        import nltk
         nltk.download('punkt')
 
 
+@lru_cache(maxsize=None)
+def nltk_tools():
+    """
+    Imports NLTK on first use since it is slow to load and only the nltk tokenizer needs it
+    :return: tuple of word_tokenize and a PorterStemmer
+    """
+    from nltk.stem import PorterStemmer
+    from nltk.tokenize import word_tokenize
+    return word_tokenize, PorterStemmer()
+
+
+@lru_cache(maxsize=TOKEN_CACHE_SIZE)
+def stem_word(word):
+    """
+    Stems a token, memoized since cracked lists repeat the same words
+    :param word: token to stem
+    :return: str
+    """
+    return nltk_tools()[1].stem(word)
+
+
+@lru_cache(maxsize=TOKEN_CACHE_SIZE)
+def leading_token(password_str):
+    """
+    Gives the first stemmed token of a password, memoized across chunks
+    :param password_str: password to tokenize
+    :return: str
+    """
+    return str(PasswordAnalyzer.gen_tokens(password_str)[0])
+
+
+class TokenCache:
+    """
+    Persistent password to leading token cache so repeated runs over overlapping lists skip tokenization
+    """
+
+    def __init__(self, cache_path, tokenizer='nltk'):
+        # tokens of earlier rules of the same tokenizer are not reused
+        self.tokenizer = TOKENIZER_RULES[tokenizer]
+        self.connection = sqlite3.connect(cache_path, timeout=60)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS tokens '
+                                '(tokenizer TEXT, password TEXT, token TEXT, PRIMARY KEY (tokenizer, password))')
+        self.connection.execute('CREATE TEMP TABLE IF NOT EXISTS wanted (password TEXT PRIMARY KEY)')
+
+    def lookup(self, passwords):
+        """
+        Fetches the cached tokens of a batch of passwords
+        :param passwords: distinct password strings
+        :return: dict of password to token
+        """
+        with self.connection:
+            self.connection.execute('DELETE FROM wanted')
+            self.connection.executemany('INSERT OR IGNORE INTO wanted VALUES (?)',
+                                        ((password,) for password in passwords))
+            rows = self.connection.execute('SELECT tokens.password, tokens.token FROM tokens JOIN wanted '
+                                           'ON tokens.password = wanted.password WHERE tokens.tokenizer = ?',
+                                           (self.tokenizer,))
+            return dict(rows)
+
+    def store(self, tokens):
+        """
+        Saves newly computed tokens
+        :param tokens: dict of password to token
+        """
+        with self.connection:
+            self.connection.executemany('INSERT OR IGNORE INTO tokens VALUES (?, ?, ?)',
+                                        ((self.tokenizer, password, token) for password, token in tokens.items()))
+
+    def close(self):
+        """
+        Closes the cache file
+        """
+        self.connection.close()
+
+
 def message(msg, title=False, stat=False, word=False, banner=False):
     """
     Prints formatted text to CLI
@@ -47,35 +166,267 @@ def message(msg, title=False, stat=False, word=False, banner=False):
         print(f'{Colors.YELLOW}{banner_text}{Colors.ENDC}')
 
 
+def current_rss():
+    """
+    Resident memory of this process in bytes, the peak where /proc is missing and 0 where neither can be read
+    :return: int
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    # macOS reports bytes and Linux kilobytes
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+def profile_stage(profile, name, rows=0):
+    """
+    Times a pipeline stage when profiling, does nothing otherwise
+    :param profile: StageProfile or None
+    :param name: stage name
+    :param rows: rows the stage processes
+    :return: context manager
+    """
+    if profile is None:
+        return nullcontext()
+    return profile.stage(name, rows)
+
+
+class StageProfile:
+    """
+    Wall time, CPU time, rows and memory growth of each pipeline stage, summed over chunks and worker processes
+    """
+
+    def __init__(self):
+        # stage name to calls, rows, wall seconds, cpu seconds and largest memory growth in bytes
+        self.stages = {}
+        self.started = self.clock()
+
+    @staticmethod
+    def clock():
+        """
+        Reads the wall clock, the CPU clock and memory
+        :return: tuple
+        """
+        return time.perf_counter(), time.process_time(), current_rss()
+
+    def record(self, name, start, rows=0, end=None):
+        """
+        Adds the time and memory between two clock readings to a stage
+        :param name: stage name
+        :param start: tuple from clock
+        :param rows: rows the stage processed
+        :param end: tuple from clock, defaults to now
+        """
+        wall, cpu, memory = end or self.clock()
+        record = self.stages.setdefault(name, [0, 0, 0.0, 0.0, 0])
+        record[0] += 1
+        record[1] += rows
+        record[2] += wall - start[0]
+        record[3] += cpu - start[1]
+        record[4] = max(record[4], memory - start[2])
+
+    @contextmanager
+    def stage(self, name, rows=0):
+        """
+        Times the body of a with statement as a stage
+        :param name: stage name
+        :param rows: rows the stage processes
+        """
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.record(name, start, rows)
+
+    def iterate(self, name, items):
+        """
+        Times producing every item of an iterable, such as reading chunks
+        :param name: stage name
+        :param items: iterable of sized items
+        :return: generator of the items
+        """
+        items = iter(items)
+        while True:
+            start = self.clock()
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            self.record(name, start, len(item))
+            yield item
+
+    def merge(self, other):
+        """
+        Adds the stages of another StageProfile, such as one recorded in a worker process
+        :param other: StageProfile
+        """
+        for name, (calls, rows, wall, cpu, memory) in other.stages.items():
+            record = self.stages.setdefault(name, [0, 0, 0.0, 0.0, 0])
+            record[0] += calls
+            record[1] += rows
+            record[2] += wall
+            record[3] += cpu
+            record[4] = max(record[4], memory)
+
+    def table(self):
+        """
+        Tabulates the stages in the order they first ran with a total of this process
+        :return: pd.DataFrame indexed by stage
+        """
+        wall, cpu, memory = self.clock()
+        df = pd.DataFrame([[calls, rows, wall_time, cpu_time, memory_growth / (1 << 20)]
+                           for calls, rows, wall_time, cpu_time, memory_growth in self.stages.values()],
+                          index=pd.Index(list(self.stages), name='Stage'),
+                          columns=['Calls', 'Rows', 'Wall', 'CPU', 'Memory MB'])
+        df.loc['total'] = [1, 0, wall - self.started[0], cpu - self.started[1], (memory - self.started[2]) / (1 << 20)]
+        df = df.astype({'Calls': 'int64', 'Rows': 'int64'})
+        df.insert(4, 'Rows/sec', (df['Rows'] / df['Wall']).where(df['Rows'] > 0))
+        return df
+
+    def print_summary(self):
+        """
+        Prints the stage table to CLI
+        """
+        message('Profile:', title=True)
+        message('Stages that ran in worker processes are summed over the workers, Memory MB is the largest growth '
+                'of resident memory during one call', stat=True)
+        print(self.table().to_string(float_format=lambda value: f'{value:,.3f}'))
+
+    def write_json(self, path):
+        """
+        Writes the stage table as JSON
+        :param path: file to write
+        """
+        df = self.table().astype(object).where(lambda table: table.notna(), None)
+        with open(path, 'w') as json_file:
+            json.dump({name: row.to_dict() for name, row in df.iterrows()}, json_file, indent=2)
+
+
+def pack_strings(strings):
+    """
+    Packs strings into one UTF-8 buffer and offsets, the form strings are saved in plain data files
+    :param strings: pd.Series, pd.Index or array of strings
+    :return: tuple of np.ndarray of bytes and np.ndarray of int64 offsets
+    """
+    encoded = [str(i).encode('utf-8', 'surrogatepass') for i in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)), out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def unpack_strings(data, offsets):
+    """
+    Unpacks strings saved by pack_strings
+    :param data: np.ndarray of bytes
+    :param offsets: np.ndarray of int64 offsets
+    :return: np.ndarray of str
+    """
+    buffer = data.tobytes()
+    return np.array([buffer[start:end].decode('utf-8', 'surrogatepass')
+                     for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())], dtype=object)
+
+
 class PasswordAnalyzer:
     """
     Takes in a list of passwords and analyzes them
     """
 
-    def __init__(self, password_df, filter_lowqual):
+    def __init__(self, password_df, filter_lowqual, token_cache=None, tokenizer='nltk', profile=None):
         self.compositionType = None
         self.mask = None
         self.alphaLst = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h', 'i', 'j', 'k', 'l', 'm', 'n', 'o', 'p', 'q', 'r', 's',
                          't', 'u', 'v', 'w', 'x', 'y', 'z']
         self.digitsLst = ['0', '1', '2', '3', '4', '5', '6', '7', '8', '9']
         self.specialLst = [' ', '!', '"', '#', '$', '%', '&', '\'', '(', ')', '*', '+', ',', '-', '.', '/', ':', ';',
-                           '<', '=', '>', '?', '@', '[', '\', \']', '^', '_', '`', '{', '|', '}', '~', ']']
+                           '<', '=', '>', '?', '@', '[', '\\', ']', '^', '_', '`', '{', '|', '}', '~']
+        self.charTable = self.build_char_table()
+        self.maskTable = np.frombuffer(MASK_CHARSETS.encode('ascii'), dtype=np.uint8)
         self.df = password_df
         self.filter = filter_lowqual
+        self.tokenCache = token_cache
+        self.rowCodes = None
+        self.tokenizer = tokenizer
+        self.profile = profile
         self.filter_percent = 0.0001
-        self.viz_label_color = '#3c444c'
-        self.viz_tick_color = '#333333'
-        self.viz_face_color = '#eeeeee'
-        self.viz_data_color1 = '#157394'
-        self.viz_data_color2 = '#dc4c4c'
 
-    def classify_passwords(self):
+    def classify_passwords(self, scan=None):
         """
         Generates primary columns per password
+        :param scan: optional result of scan_passwords to reuse
+        """
+        char_classes, offsets = scan if scan is not None else self.scan_passwords(self.df['Password'])
+        classes, complexity, length = self.rank_passwords(char_classes, offsets)
+        self.df['Class'] = pd.Categorical.from_codes(classes, categories=CLASS_LABELS).remove_unused_categories()
+        self.df['Complexity'] = pd.Series(complexity, index=self.df.index).astype('uint8')
+        # uint32 since lines of junk or long passphrases easily pass the 127 characters int8 held
+        self.df['Length'] = pd.Series(length, index=self.df.index).astype('uint32')
+
+    def build_char_table(self):
+        """
+        Builds a 256 entry lookup table mapping UTF-8 bytes to character classes
+        :return: np.ndarray
         """
-        self.df['Class'] = self.df['Password'].apply(lambda x: self.test_class(x)).astype('category')
-        self.df['Complexity'] = self.df['Password'].apply(lambda x: self.test_complexity(x)).astype('int8')
-        self.df['Length'] = self.df['Password'].apply(len).astype('int8')
+        table = np.full(256, CHAR_OTHER, dtype=np.uint8)
+        # continuation bytes of multibyte characters are not characters of their own
+        table[0x80:0xC0] = CHAR_CONT
+        for char_lst, char_class in ((self.digitsLst, CHAR_DIGIT), (self.alphaLst, CHAR_LOWER),
+                                     (map(str.upper, self.alphaLst), CHAR_UPPER), (self.specialLst, CHAR_SPECIAL)):
+            for char in char_lst:
+                if len(char) == 1:
+                    table[ord(char)] = char_class
+        return table
+
+    def scan_passwords(self, passwords):
+        """
+        Classifies every character of a password column in one pass over a packed UTF-8 buffer
+        :param passwords: iterable of password strings
+        :return: tuple of per byte character classes and per password byte offsets
+        """
+        encoded = [str(password).encode('utf-8', 'surrogatepass') for password in passwords]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)), out=offsets[1:])
+        return self.charTable[np.frombuffer(b''.join(encoded), dtype=np.uint8)], offsets
+
+    @staticmethod
+    def segment_sum(values, offsets):
+        """
+        Sums values within each password segment of a packed buffer
+        :param values: np.ndarray with one value per byte
+        :param offsets: np.ndarray of segment boundaries
+        :return: np.ndarray
+        """
+        starts = offsets[:-1]
+        sums = np.zeros(len(starts), dtype=np.int64)
+        nonempty = offsets[1:] > starts
+        if nonempty.any():
+            sums[nonempty] = np.add.reduceat(values, starts[nonempty], dtype=np.int64)
+        return sums
+
+    def rank_passwords(self, char_classes, offsets):
+        """
+        Derives class codes, complexity and length from per byte character classes
+        :param char_classes: np.ndarray from scan_passwords
+        :param offsets: np.ndarray from scan_passwords
+        :return: tuple of np.ndarray (class code, complexity, length)
+        """
+        digits, lower, upper, special = (self.segment_sum(char_classes == char_class, offsets)
+                                         for char_class in (CHAR_DIGIT, CHAR_LOWER, CHAR_UPPER, CHAR_SPECIAL))
+        length = self.segment_sum(char_classes != CHAR_CONT, offsets)
+
+        complexity = (digits > 0).astype(np.int8) + (lower > 0) + (upper > 0) + (special > 0)
+        # 8+ characters earn 2: okay, 12+ 3: good and 16+ 4: great when 3 of the 4 criteria are met
+        tier = np.select([length >= 16, length >= 12, length >= 8], [4, 3, 2], default=1).astype(np.int8)
+        classes = np.where(complexity >= 3, tier, 0).astype(np.int8)
+        # two of every criteria promotes 8+ character passwords one class further
+        well_mixed = (digits >= 2) & (lower >= 2) & (upper >= 2) & (special >= 2) & (length >= 8)
+        classes[well_mixed] += 1
+        return classes, complexity, length
 
     def test_class(self, password_str):
         """
@@ -83,74 +434,8 @@ class PasswordAnalyzer:
         :param password_str: password to classify
         :return: str
         """
-        digits = 0
-        lower = 0
-        upper = 0
-        special = 0
-        length = len(password_str)
-
-        if any(item in password_str for item in self.digitsLst):
-            for char in self.digitsLst:
-                digits += password_str.count(char)
-        if any(item in password_str for item in self.alphaLst):
-            for char in self.alphaLst:
-                lower += password_str.count(char)
-        if any(item in password_str for item in map(str.upper, self.alphaLst)):
-            for char in map(str.upper, self.alphaLst):
-                upper += password_str.count(char)
-        if any(item in password_str for item in self.specialLst):
-            for char in self.specialLst:
-                special += password_str.count(char)
-
-        if length >= 16:
-            if all(v >= 2 for v in [digits, lower, upper, special]):
-                return "5: strong"
-            elif all(v >= 1 for v in [digits, upper, lower]):
-                return "4: great"
-            elif all(v >= 1 for v in [digits, lower, special]):
-                return "4: great"
-            elif all(v >= 1 for v in [digits, upper, special]):
-                return "4: great"
-            elif all(v >= 1 for v in [lower, upper, special]):
-                return "4: great"
-            else:
-                return "0: subpar"
-        elif length >= 12:
-            if all(v >= 2 for v in [digits, lower, upper, special]):
-                return "4: great"
-            elif all(v >= 1 for v in [digits, upper, lower]):
-                return "3: good"
-            elif all(v >= 1 for v in [digits, lower, special]):
-                return "3: good"
-            elif all(v >= 1 for v in [digits, upper, special]):
-                return "3: good"
-            elif all(v >= 1 for v in [lower, upper, special]):
-                return "3: good"
-            else:
-                return "0: subpar"
-        elif length >= 8:
-            if all(v >= 2 for v in [digits, lower, upper, special]):
-                return "3: good"
-            elif all(v >= 1 for v in [digits, upper, lower]):
-                return "2: okay"
-            elif all(v >= 1 for v in [digits, lower, special]):
-                return "2: okay"
-            elif all(v >= 1 for v in [digits, upper, special]):
-                return "2: okay"
-            elif all(v >= 1 for v in [lower, upper, special]):
-                return "2: okay"
-            else:
-                return "0: subpar"
-        else:
-            if all(v >= 1 for v in [digits, upper, lower]):
-                return "1: minimum"
-            elif all(v >= 1 for v in [digits, lower, special]):
-                return "1: minimum"
-            elif all(v >= 1 for v in [digits, upper, special]):
-                return "1: minimum"
-            elif all(v >= 1 for v in [lower, upper, special]):
-                return "1: minimum"
-            return '0: subpar'
+        classes, _, _ = self.rank_passwords(*self.scan_passwords([password_str]))
+        return CLASS_LABELS[classes[0]]
 
     def test_complexity(self, password_str):
         """
@@ -158,22 +443,48 @@ class PasswordAnalyzer:
         :param password_str: string to rate
         :return: int
         """
-        complexity = 0
-        if any(item in password_str for item in self.digitsLst):
-            complexity += 1
-        if any(item in password_str for item in self.alphaLst):
-            complexity += 1
-        if any(item in password_str for item in map(str.upper, self.alphaLst)):
-            complexity += 1
-        if any(item in password_str for item in self.specialLst):
-            complexity += 1
-        return complexity
+        _, complexity, _ = self.rank_passwords(*self.scan_passwords([password_str]))
+        return int(complexity[0])
 
-    def gen_masks(self):
+    def gen_masks(self, scan=None):
         """
         Generates a Hashcat mask for each password as a new column
+        :param scan: optional result of scan_passwords to reuse
         """
-        self.df['Mask'] = df['Password'].apply(lambda x: self.make_mask(x)).astype('category')
+        char_classes, offsets = scan if scan is not None else self.scan_passwords(self.df['Password'])
+        self.df['Mask'] = pd.Series(self.build_masks(char_classes, offsets), index=self.df.index)
+
+    def build_masks(self, char_classes, offsets):
+        """
+        Translates per byte character classes into Hashcat masks for every password at once
+        :param char_classes: np.ndarray from scan_passwords
+        :param offsets: np.ndarray from scan_passwords
+        :return: pd.Categorical
+        """
+        is_char = char_classes != CHAR_CONT
+        symbols = self.maskTable[char_classes[is_char]]
+        char_ends = np.cumsum(self.segment_sum(is_char, offsets))
+
+        # split the charsets out a block of passwords at a time, numbering them in order of first appearance
+        codes = np.zeros(len(char_ends), dtype=np.int64)
+        charset_codes = {}
+        start = 0
+        for i in range(0, len(char_ends), STRING_BLOCK):
+            ends = char_ends[i:i + STRING_BLOCK] - start
+            # pack the charset symbols of each password followed by a separator then split them back out
+            packed = np.full(ends[-1] + len(ends), ord('|'), dtype=np.uint8)
+            is_symbol = np.ones(len(packed), dtype=bool)
+            is_symbol[ends + np.arange(len(ends))] = False
+            packed[is_symbol] = symbols[start:start + ends[-1]]
+            block_codes, uniques = pd.factorize(np.array(packed.tobytes().decode('ascii').split('|')[:-1],
+                                                         dtype=object))
+            positions = np.array([charset_codes.setdefault(unique, len(charset_codes)) for unique in uniques],
+                                 dtype=np.int64)
+            codes[i:i + len(ends)] = positions[block_codes]
+            start += ends[-1]
+
+        masks = [''.join('?' + charset for charset in charset) for charset in charset_codes]
+        return pd.Categorical.from_codes(codes, categories=masks).reorder_categories(sorted(masks))
 
     def make_mask(self, password_str):
         """
@@ -181,33 +492,57 @@ class PasswordAnalyzer:
         :param password_str: string to make mask of
         :return: string
         """
-        mask = ''
-        for i in password_str:
-            if i in self.digitsLst:
-                mask += "?d"
-            elif i in self.alphaLst:
-                mask += "?l"
-            elif i in map(str.upper, self.alphaLst):
-                mask += "?u"
-            elif i in self.specialLst:
-                mask += "?s"
-            else:
-                mask += "?a"
-        return mask
+        return str(self.build_masks(*self.scan_passwords([password_str]))[0])
 
     def tokenize_passwords(self):
         """
         Generates a token list for each password as a new column
         :return: pd.DataFrame
         """
-        nested_tokens = self.df['Password'].apply(lambda i: self.gen_tokens(i))
-        expanded_tokens = [str(item[0]) for item in nested_tokens]
-        df_tokens = pd.DataFrame(expanded_tokens).value_counts(ascending=False).to_frame().set_axis(['Count'], axis=1,
-                                                                                                    inplace=False).reset_index()
-        df_tokens.columns = ['Tokens', 'Count']
-        df_tokens.reset_index(drop=True)
-        df_tokens = df_tokens[df_tokens['Count'] > 1]
-        return df_tokens
+        return PasswordStats.token_table(self.count_tokens())
+
+    def count_tokens(self):
+        """
+        Counts the leading token of every password, tokenizing each distinct password once
+        :return: pd.Series of counts indexed by token
+        """
+        codes, uniques = pd.factorize(self.df['Password'])
+        counts = np.bincount(codes, weights=self.password_counts(), minlength=len(uniques)).astype('int64')
+        # tokenize in blocks so only one block of passwords and tokens is held as Python strings at a time
+        parts = []
+        for i in range(0, max(len(uniques), 1), STRING_BLOCK):
+            token_counts = pd.Series(counts[i:i + STRING_BLOCK], dtype='int64',
+                                     index=pd.Index(self.leading_tokens(uniques[i:i + STRING_BLOCK]), dtype=object))
+            parts.append(token_counts.groupby(level=0).sum())
+        return parts[0] if len(parts) == 1 else PasswordStats.fold(parts)
+
+    def leading_tokens(self, passwords):
+        """
+        Looks up the leading token of each password in the token cache and tokenizes the rest
+        :param passwords: distinct password strings
+        :return: list of str
+        """
+        if self.tokenCache is None:
+            return self.tokenize_leading(passwords)
+        tokens = self.tokenCache.lookup(passwords)
+        missing = [password for password in passwords if password not in tokens]
+        missing = dict(zip(missing, self.tokenize_leading(missing)))
+        self.tokenCache.store(missing)
+        tokens.update(missing)
+        return [tokens[password] for password in passwords]
+
+    def tokenize_leading(self, passwords):
+        """
+        Tokenizes passwords with the selected backend and keeps the first token of each
+        :param passwords: password strings
+        :return: list of str
+        """
+        if self.tokenizer == 'nltk':
+            return [leading_token(password) for password in passwords]
+        passwords = pd.Series(passwords, dtype=object).str.lower()
+        if self.tokenizer == 'leet':
+            passwords = passwords.str.replace(LEET_PATTERN, lambda i: i.group(0).translate(LEET_LETTERS), regex=True)
+        return passwords.str.extract('^(' + TOKEN_PATTERN + ')', expand=False).fillna('').tolist()
 
     @staticmethod
     def gen_tokens(password_str):
@@ -216,104 +551,200 @@ class PasswordAnalyzer:
         :param password_str: password to tokenize
         :return: list
         """
+        word_tokenize, _ = nltk_tools()
         try:
             words = word_tokenize(password_str)
-            stemmed_words = [stemmer.stem(word) for word in words]
+            stemmed_words = [stem_word(word) for word in words]
         except IndexError:
             stemmed_words = ['']
         return stemmed_words
 
+    def password_counts(self):
+        """
+        Gives how many input rows each row of the DF stands for
+        :return: np.ndarray
+        """
+        if 'Count' in self.df:
+            return self.df['Count'].values
+        return np.ones(len(self.df), dtype=np.int64)
+
+    def collapse_passwords(self):
+        """
+        Collapses the input to distinct passwords and their counts so analysis runs once per password
+        """
+        if 'Count' in self.df:
+            return
+        self.rowCodes, uniques = pd.factorize(self.df['Password'])
+        if len(uniques) < 1 << 31:
+            self.rowCodes = self.rowCodes.astype(np.int32)
+        self.df = pd.DataFrame({'Password': uniques,
+                                'Count': np.bincount(self.rowCodes, minlength=len(uniques)).astype('int64')})
+
+    def mask_examples(self, count):
+        """
+        Picks the first distinct passwords of every mask using the integer mask codes
+        :param count: number of examples per mask
+        :return: pd.DataFrame of Mask and Password
+        """
+        df_examples = self.df[['Mask', 'Password']].groupby(self.df['Mask'].cat.codes.values, sort=False).head(count)
+        return pd.DataFrame({'Mask': df_examples['Mask'].astype(object).values,
+                             'Password': df_examples['Password'].values})
+
+    def row_table(self):
+        """
+        Expands the analyzed distinct passwords back to one row per input password in input order
+        :return: pd.DataFrame
+        """
+        if self.rowCodes is None:
+            return self.df
+        positions = self.df.index.get_indexer(self.rowCodes)
+        return self.df.iloc[positions[positions >= 0]].drop(columns='Count').reset_index(drop=True)
+
     def analyze_passwords(self):
         """
         Calls primary analysis functions
         """
-        self.classify_passwords()
+        with profile_stage(self.profile, 'collapse', len(self.df)):
+            self.collapse_passwords()
+        with profile_stage(self.profile, 'scan', len(self.df)):
+            scan = self.scan_passwords(self.df['Password'])
+        with profile_stage(self.profile, 'classify', len(self.df)):
+            self.classify_passwords(scan)
+        with profile_stage(self.profile, 'mask', len(self.df)):
+            self.gen_masks(scan)
         if self.filter:
-            self.df = self.df[self.df['Class'] != '0: subpar']
-        else:
-            self.df = self.df
-        self.gen_masks()
+            with profile_stage(self.profile, 'filter', len(self.df)):
+                self.df = self.df[self.df['Class'] != '0: subpar']
 
-    def lookup_directory(self, compare_dir):
+    def lookup_directory(self, compare_dir, compare_cache=None, threads=COMPARE_THREADS):
         """
-        Looks up a directory and all files inside for comparison
+        Looks up a directory and all files inside for comparison, probing up to threads files at once
         :param compare_dir: directory full of password lists
+        :param compare_cache: optional dict keeping the hashes of lists between calls when analyzing chunks
+        :param threads: compare files read and probed concurrently
         """
         # try error for file load fail
         if compare_dir:
-            for i in os.listdir(compare_dir):
-                title = 'Is In ' + i
-                df_compare = pd.read_table(os.path.join(compare_dir, i), header=None, names=['Password'],
-                                           encoding='ISO-8859-1')
-                self.lookup_password(df_compare, title)
+            compare_names = list_compare_files(compare_dir)
+            codes, uniques = pd.factorize(self.df['Password'])
+            uniques = pd.Index(uniques)
+            probe = lambda compare_name: self.probe_file(compare_dir, compare_name, uniques, compare_cache)
+            if threads > 1 and len(compare_names) > 1:
+                with ThreadPoolExecutor(min(threads, len(compare_names))) as executor:
+                    results = list(executor.map(probe, compare_names))
+            else:
+                results = [probe(compare_name) for compare_name in compare_names]
+            columns = {}
+            for compare_name, (found, start, end) in zip(compare_names, results):
+                if self.profile is not None:
+                    self.profile.record('compare ' + compare_name, start, len(self.df), end)
+                columns['Is In ' + compare_name] = found[codes].astype('int8')
+            self.df = self.df.assign(**columns)
 
-    def lookup_password(self, compare_df, title):
+    @staticmethod
+    def probe_file(compare_dir, compare_name, uniques, compare_cache=None):
         """
-        Compares two password lists for shared passwords then reports in a new column
-        :param compare_df: dataframe to compare against
-        :param title: string name of created column
-        :return: none (appends to given df)
+        Finds which distinct passwords are in one compare list, safe to run in a thread per list
+        :param compare_dir: directory of the list
+        :param compare_name: file name of the list
+        :param uniques: pd.Index of distinct passwords
+        :param compare_cache: optional dict keeping the hashes of lists between calls when analyzing chunks
+        :return: tuple of np.ndarray of bool per distinct password and the StageProfile clock readings around the probe
         """
-        df_joined = self.df.merge(compare_df, how='inner', on=['Password'])
-        lst_joined = list(set(df_joined.Password.unique().tolist()))
-
-        for q in lst_joined:
-            self.df.loc[(self.df['Password'] == q), str(title)] = 1
-        self.df[title].fillna(0, inplace=True)
-        self.df[title] = self.df[title].astype('int8')
+        start = StageProfile.clock()
+        compare_path = os.path.join(compare_dir, compare_name)
+        compare_index = load_compare_index(compare_path)
+        if compare_index is not None:
+            found = probe_index(uniques, compare_index)
+        elif compare_cache is None:
+            found = probe_chunks(uniques, read_compare(compare_path, COMPARE_CHUNKSIZE))
+        else:
+            # keyed like a compare index so a list rewritten between chunks is read again
+            stat = os.stat(compare_path)
+            key = (compare_path, stat.st_size, stat.st_mtime_ns)
+            if key not in compare_cache:
+                for stale in [i for i in compare_cache if i[0] == compare_path]:
+                    compare_cache.pop(stale, None)
+                # setdefault keeps the first hashes when two threads load the same file
+                compare_cache.setdefault(key, compare_hashes(compare_path))
+            found = probe_index(uniques, compare_cache[key])
+        return found, start, StageProfile.clock()
 
-    def report(self):
+    def report(self, stats=None):
         """
-        Generates aggregate DFs for printing and print stats to CLI
+        Generates the aggregate tables of the analyzed passwords
+        :param stats: optional PasswordStats folded over several chunks, defaults to the analyzed passwords
+        :return: PasswordReport
         """
-        df_tokens = pwdAnalyzer.tokenize_passwords()
+        if stats is None:
+            stats = PasswordStats()
+            stats.update(self)
+        return PasswordReport(stats, self.filter, self.filter_percent)
 
-        df_class_agg = self.df.groupby(by='Class').agg(
-            {'Password': 'count', 'Complexity': 'mean', 'Length': 'mean'}).reset_index()
-        df_class_agg.columns = ['Class', 'Password', 'Complexity', 'Length']
-        df_class_agg.reset_index(drop=True)
-        df_class_agg.rename(columns={'Password': 'Count'}, inplace=True)
 
-        df_mask_agg = self.df.groupby(by='Mask').agg(
-            {'Password': 'count', 'Complexity': 'mean', 'Length': 'mean'}).sort_values(by='Password',
-                                                                                       ascending=False).reset_index()
-        df_mask_agg.columns = ['Mask', 'Password', 'Complexity', 'Length']
-        df_mask_agg.reset_index(drop=True)
-        # may need to comment the line below when dealing with small input
-        df_mask_agg = df_mask_agg[df_mask_agg['Password'] > 1]
-        df_mask_agg.rename(columns={'Password': 'Count'}, inplace=True)
+class PasswordReport:
+    """
+    Result tables of an analysis, returned to library callers and printed or written out by the CLI
+    """
 
-        df_password_agg = self.df.groupby(by='Password').agg(
-            {'Password': 'count', 'Complexity': 'mean', 'Length': 'mean'}).rename_axis(None).sort_values(by='Password',
-                                                                                                         ascending=False).reset_index()
-        df_password_agg.columns = ['Password', 'Count', 'Complexity', 'Length']
-        df_password_agg.reset_index(drop=True)
+    def __init__(self, stats, filter_lowqual=False, filter_percent=0.0001):
+        self.tokens, self.classes, self.masks, self.passwords = stats.aggregate()
+        if filter_lowqual:
+            self.masks = self.masks[self.masks['Count'] > round(self.masks.size * filter_percent, 0)]
+            self.tokens = self.tokens[self.tokens['Count'] > round(self.tokens.size * filter_percent, 0)]
+        self.class_sums = stats.classes.reindex(CLASS_LABELS, fill_value=0)
+        self.hits = stats.hits
+        self.mask_examples = stats.example_index(self.masks['Mask'])
+        # every mask including those used once, the keyspace planner weighs rare masks too
+        self.mask_counts = stats.masks['Count']
+        self.viz_label_color = '#3c444c'
+        self.viz_tick_color = '#333333'
+        self.viz_face_color = '#eeeeee'
+        self.viz_data_color1 = '#157394'
+        self.viz_data_color2 = '#dc4c4c'
 
-        if self.filter:
-            df_mask_agg = df_mask_agg[df_mask_agg['Count'] > round(df_mask_agg.size * self.filter_percent, 0)]
-            df_tokens = df_tokens[df_tokens['Count'] > round(df_tokens.size * self.filter_percent, 0)]
+    def print_report(self):
+        """
+        Prints all stats to CLI
+        """
+        self.print_stats(self.class_sums, 'full')
+        self.print_stats(self.passwords, 'password_agg')
+        self.print_stats(self.tokens, 'tokens')
+        self.print_stats(self.masks, 'mask_agg')
 
-        self.print_stats(self.df, 'full')
-        self.print_stats(df_password_agg, 'password_agg')
-        self.print_stats(df_tokens, 'tokens')
-        self.print_stats(df_mask_agg, 'mask_agg')
+    def write_csv(self, output_dir):
+        """
+        Writes the aggregate tables as tab separated files
+        :param output_dir: directory to write into
+        """
+        self.write_tables(output_dir, 'tsv')
 
-        if args.output:
-            df_tokens.to_csv(os.path.join(args.output, 'common_tokens.csv'), index=False, quoting=3, quotechar='',
-                             escapechar='', sep='\t')
-            df_class_agg.to_csv(os.path.join(args.output, 'password_classes.csv'), index=False, quoting=3, quotechar='',
-                                escapechar='', sep='\t')
-            df_mask_agg.to_csv(os.path.join(args.output, 'password_masks.csv'), index=False, quoting=3, quotechar='',
-                               escapechar='', sep='\t')
-            df_password_agg.to_csv(os.path.join(args.output, 'passwords_agg.csv'), index=False, quoting=3, quotechar='',
-                                   escapechar='', sep='\t')
-
-        if args.viz:
-            self.print_viz(df_tokens.head(20).set_index('Tokens'), 'bar' , 'Common Password Tokens', 'Count', 'Token', 'common-password-tokens')
-            self.print_viz(df_class_agg.set_index('Class')['Count'], 'bar' , 'Password Classes of Cracked Passwords', 'Count', 'Class', 'password-classes')
-            self.print_viz(df_class_agg.set_index('Class').drop(columns=['Count', 'Complexity']), 'box' , 'Average Length of Cracked Passwords', 'Count', 'Length', 'avg-password-length')
-            self.print_viz(df_mask_agg.head(20).set_index('Mask').drop(columns=['Complexity', 'Length']), 'bar' , 'Common Password Masks', 'Count', 'Mask', 'common-password-masks')
+    def write_tables(self, output_dir, file_format='tsv', profile=None):
+        """
+        Writes the aggregate tables in row groups
+        :param output_dir: directory to write into
+        :param file_format: one of OUTPUT_FORMATS
+        :param profile: optional StageProfile timing each table
+        """
+        for name, df in [('common_tokens', self.tokens), ('password_classes', self.classes),
+                         ('password_masks', self.masks), ('passwords_agg', self.passwords)]:
+            table_writer = TableWriter(output_dir, name, file_format, profile)
+            table_writer.write(df)
+            table_writer.close()
 
+    def write_viz(self, output_dir):
+        """
+        Saves charts of the aggregate tables
+        :param output_dir: directory to save into
+        """
+        self.print_viz(self.tokens.head(20).set_index('Tokens'), 'bar', 'Common Password Tokens', 'Count', 'Token',
+                       output_dir, 'common-password-tokens')
+        self.print_viz(self.classes.set_index('Class')['Count'], 'bar', 'Password Classes of Cracked Passwords',
+                       'Count', 'Class', output_dir, 'password-classes')
+        self.print_viz(self.classes.set_index('Class').drop(columns=['Count', 'Complexity']), 'box',
+                       'Average Length of Cracked Passwords', 'Count', 'Length', output_dir, 'avg-password-length')
+        self.print_viz(self.masks.head(20).set_index('Mask').drop(columns=['Complexity', 'Length']), 'bar',
+                       'Common Password Masks', 'Count', 'Mask', output_dir, 'common-password-masks')
 
     def print_stats(self, df2print, type_str):
         """
@@ -322,105 +753,958 @@ class PasswordAnalyzer:
         :param type_str: string that contains the type of DF being passed
         """
         if type_str == 'full':
+            total = df2print['Count'].sum()
             message('Password Stats:', title=True)
             message('Reminder the sample is ONLY cracked passwords and data points should be reflected on as so',
                     stat=True)
             message(
                 'Microsoft minimum password complexity requires 3 of the following criteria: 1 lowercase, 1 uppercase, 1 digit, and 1 special character.\n',
                 stat=True)
-            message('There are ' + message(str(len(df2print)),
+            message('There are ' + message(str(total),
                                            word=True) + ' passwords in the sample and the average complexity is ' + message(
-                str(round(df2print['Complexity'].mean(), 1)) + '/4',
+                str(round(self.safe_mean(df2print['Complexity'].sum(), total), 1)) + '/4',
                 word=True) + ' and the average length is ' + message(
-                str(round(df2print['Length'].mean(), 1)), word=True), stat=True)
-            message(message(str(df2print['Class'][df2print['Class'] == '0: subpar'].count()),
-                            word=True) + ' passwords were considered subpar and did not meet minimum password requirements and had an average length of ' + message(
-                str(round(df2print['Length'][df2print['Class'] == '0: subpar'].mean(), 1)), word=True), stat=True)
-            message(message(str(df2print['Class'][df2print['Class'] == '1: minimum'].count()),
-                            word=True) + ' passwords met the minimum complexity requirements and had an average length of ' + message(
-                str(round(df2print['Length'][df2print['Class'] == '1: minimum'].mean(), 1)), word=True), stat=True)
-            message(message(str(df2print['Class'][df2print['Class'] == '2: okay'].count()),
-                            word=True) + ' passwords met or exceeded minimum complexity requirements and had an average length of ' + message(
-                str(round(df2print['Length'][df2print['Class'] == '2: okay'].mean(), 1)), word=True), stat=True)
-            message(message(str(df2print['Class'][df2print['Class'] == '3: good'].count()),
-                            word=True) + ' passwords met or exceeded minimum complexity requirements and had a strong password length averaging ' + message(
-                str(round(df2print['Length'][df2print['Class'] == '3: good'].mean(), 1)), word=True), stat=True)
-            message(message(str(df2print['Class'][df2print['Class'] == '4: great'].count()),
-                            word=True) + ' passwords met or exceeded minimum complexity requirements and had a very strong password length averaging ' + message(
-                str(round(df2print['Length'][df2print['Class'] == '4: great'].mean(), 1)), word=True), stat=True)
-            message(message(str(df2print['Class'][df2print['Class'] == '5: strong'].count()),
-                            word=True) + ' passwords well exceeded minimum complexity requirements and had a fortified password length averaging ' + message(
-                str(round(df2print['Length'][df2print['Class'] == '5: strong'].mean(), 1)), word=True), stat=True)
-
-            if args.compare:
+                str(round(self.safe_mean(df2print['Length'].sum(), total), 1)), word=True), stat=True)
+            for label, description in zip(CLASS_LABELS, [
+                    ' passwords were considered subpar and did not meet minimum password requirements and had an average length of ',
+                    ' passwords met the minimum complexity requirements and had an average length of ',
+                    ' passwords met or exceeded minimum complexity requirements and had an average length of ',
+                    ' passwords met or exceeded minimum complexity requirements and had a strong password length averaging ',
+                    ' passwords met or exceeded minimum complexity requirements and had a very strong password length averaging ',
+                    ' passwords well exceeded minimum complexity requirements and had a fortified password length averaging ']):
+                message(message(str(df2print['Count'][label]), word=True) + description + message(
+                    str(round(self.safe_mean(df2print['Length'][label], df2print['Count'][label]), 1)), word=True),
+                        stat=True)
+
+            if len(self.hits):
                 message('Password Lookup:', title=True)
-                for i in os.listdir(args.compare):
-                    try:
-                        message(message(str(df2print['Is In ' + str(i)].sum()),
-                                        word=True) + ' passwords were also in ' + message(str(i), word=True), stat=True)
-                    except KeyError:
-                        pass
+                for title, hits in self.hits.items():
+                    message(message(str(hits), word=True) + ' passwords were also in ' + message(
+                        title[len('Is In '):], word=True), stat=True)
 
         elif type_str == 'password_agg':
             message('Reused Passwords:', title=True)
-            for i in range(0, 8):
-                if df2print.empty:
-                    message('Empty input file for the function', stat=True)
-                    break
-                message(message(str(df2print['Password'].iloc[i]), word=True) + ' occurred ' + message(
-                    str(df2print['Count'].iloc[i]), word=True) + ' times', stat=True)
+            if df2print.empty:
+                message('Empty input file for the function', stat=True)
+            for row in df2print.head(8).itertuples():
+                message(message(str(row.Password), word=True) + ' occurred ' + message(
+                    str(row.Count), word=True) + ' times', stat=True)
 
         elif type_str == 'tokens':
             message('Common Tokens and Words in Passwords:', title=True)
-            for i in range(0, 8):
-                if df2print.empty:
-                    message('Empty input file for the function', stat=True)
-                    break
-                message('The token ' + message(str(df2print['Tokens'].iloc[i]), word=True) + ' was used ' + message(
-                    str(df2print['Count'].iloc[i]), word=True) + ' times', stat=True)
+            if df2print.empty:
+                message('Empty input file for the function', stat=True)
+            for row in df2print.head(8).itertuples():
+                message('The token ' + message(str(row.Tokens), word=True) + ' was used ' + message(
+                    str(row.Count), word=True) + ' times', stat=True)
 
         elif type_str == 'mask_agg':
             message('Common Password Masks:', title=True)
-            for i in range(0, 8):
-                if df2print.empty:
-                    message('Empty input file for the function. Note masks that occurred only once are dropped.',
-                            stat=True)
-                    break
-                message(message(str(df2print['Count'].iloc[i]), word=True) + ' passwords used the mask ' + message(
-                    str(df2print['Mask'].iloc[i]), word=True), stat=True)
-                try:
-                    message('For example: ' + message(
-                        str(self.df['Password'][self.df['Mask'] == str(df2print['Mask'].iloc[i])].iloc[0]),
-                        word=True) + ', ' + message(
-                        str(self.df['Password'][self.df['Mask'] == str(df2print['Mask'].iloc[i])].iloc[1]),
-                        word=True) + ', and ' + message(
-                        str(self.df['Password'][self.df['Mask'] == str(df2print['Mask'].iloc[i])].iloc[2]), word=True),
-                            stat=True)
-                except IndexError:
-                    try:
-                        message('For example: ' + message(
-                            str(self.df['Password'][self.df['Mask'] == str(df2print['Mask'].iloc[i])].iloc[0]),
-                            word=True) + ', ' + message(
-                            str(self.df['Password'][self.df['Mask'] == str(df2print['Mask'].iloc[i])].iloc[1]),
-                            word=True))
-                    except IndexError:
-                        message('For example: ' + message(
-                            str(self.df['Password'][self.df['Mask'] == str(df2print['Mask'].iloc[i])].iloc[0]),
-                            word=True))
-
-    def print_viz(self, df, chart_type, title, xlabel, ylabel, output_name):
+            if df2print.empty:
+                message('Empty input file for the function. Note masks that occurred only once are dropped.',
+                        stat=True)
+            for row in df2print.head(8).itertuples():
+                message(message(str(row.Count), word=True) + ' passwords used the mask ' + message(
+                    str(row.Mask), word=True), stat=True)
+                examples = self.mask_examples.get(row.Mask, [])
+                if len(examples) > 2:
+                    message('For example: ' + message(str(examples[0]), word=True) + ', ' + message(
+                        str(examples[1]), word=True) + ', and ' + message(str(examples[2]), word=True), stat=True)
+
+    def mask_plan(self, hash_rate, time_budget=None):
+        """
+        Orders the masks for a Hashcat mask attack, see plan_masks
+        :param hash_rate: hashes per second
+        :param time_budget: optional seconds the attack may run
+        :return: pd.DataFrame
+        """
+        return plan_masks(self.mask_counts, hash_rate, time_budget)
+
+    def print_plan(self, plan, hash_rate):
+        """
+        Prints the coverage and run time of a mask attack plan to CLI
+        :param plan: pd.DataFrame from mask_plan
+        :param hash_rate: hashes per second the plan was made for
+        """
+        message('Mask Attack Plan:', title=True)
+        if plan.empty:
+            message('No mask fits the time budget', stat=True)
+            return
+        message(message(str(len(plan)), word=True) + ' masks cover ' + message(
+            f'{plan["Coverage"].iloc[-1]:.1%}', word=True) + ' of the sample in ' + message(
+            format_duration(plan['Seconds'].iloc[-1]), word=True) + ' at ' + message(
+            f'{hash_rate:,.0f}', word=True) + ' hashes per second', stat=True)
+        for row in plan.head(8).itertuples(index=False):
+            message(message(row.Mask, word=True) + ' cracks ' + message(str(row.Count), word=True) + ' of ' + message(
+                f'{row.Keyspace:,.0f}', word=True) + ' candidates, ' + message(f'{row.Coverage:.1%}', word=True) +
+                ' covered after ' + message(format_duration(row.Seconds), word=True), stat=True)
+
+    @staticmethod
+    def write_hcmask(plan, path):
+        """
+        Writes the masks of a plan in order as a Hashcat .hcmask file
+        :param plan: pd.DataFrame from mask_plan
+        :param path: file to write
+        """
+        with open(path, 'w', newline='\n') as hcmask_file:
+            hcmask_file.writelines(mask + '\n' for mask in plan['Mask'])
+
+    @staticmethod
+    def safe_mean(total, count):
+        """
+        Divides a running sum by its count without warning on empty groups
+        :param total: sum of values
+        :param count: number of values
+        :return: float
+        """
+        return total / count if count else float('nan')
 
+    def print_viz(self, df, chart_type, title, xlabel, ylabel, output_dir, output_name):
+        """
+        Saves a chart of a DF as a PDF
+        :param df: pd.DataFrame to plot
+        :param chart_type: bar or box
+        :param title: chart title
+        :param xlabel: x axis label
+        :param ylabel: y axis label
+        :param output_dir: directory to save into
+        :param output_name: file name without extension
+        """
         if chart_type == 'bar':
             ax = df.plot(kind="barh", fontsize=5, color=self.viz_data_color1, alpha=0.5)
         elif chart_type == 'box':
-           ax = df.plot.box(vert=False)
-        
+            ax = df.plot.box(vert=False)
+
         ax.set_title(title, color=self.viz_label_color)
         ax.set_xlabel(xlabel, color=self.viz_label_color)
         ax.set_ylabel(ylabel, color=self.viz_label_color)
         ax.tick_params(labelcolor=self.viz_tick_color)
         ax.set_facecolor(self.viz_face_color)
-        ax.figure.savefig(os.path.join(args.output, str(output_name) + '.pdf'))
+        ax.figure.savefig(os.path.join(output_dir, str(output_name) + '.pdf'))
+
+
+class TableWriter:
+    """
+    Appends DataFrames to one result table in row groups so a table is never copied whole for writing
+    """
+
+    def __init__(self, output_dir, name, file_format='tsv', profile=None):
+        if file_format not in OUTPUT_FORMATS:
+            raise ValueError('Unknown output format ' + str(file_format))
+        self.path = os.path.join(output_dir, name + OUTPUT_EXTENSIONS[file_format])
+        self.name = name
+        self.file_format = file_format
+        self.profile = profile
+        self.writer = None
+        self.output_file = None
+        # Arrow tables waiting for a full row group
+        self.pending = []
+        self.pending_rows = 0
+        # categories seen so far per column, only ever appended to so earlier codes stay valid
+        self.dictionaries = {}
+
+    def write(self, df):
+        """
+        Appends a DF to the table, Parquet and Arrow rows are converted a row group at a time and the last rows are
+        held until later writes fill their row group of ROW_GROUP_SIZE rows
+        :param df: pd.DataFrame with the same columns as earlier writes
+        """
+        with profile_stage(self.profile, 'write ' + self.name, len(df)):
+            if self.file_format == 'tsv':
+                self.write_tsv(df)
+                return
+            start = 0
+            while True:
+                part = df.iloc[start:start + ROW_GROUP_SIZE - self.pending_rows]
+                start += len(part)
+                self.pending.append(self.arrow_table(part))
+                self.pending_rows += len(part)
+                if self.pending_rows == ROW_GROUP_SIZE:
+                    self.flush()
+                if start >= len(df):
+                    break
+
+    def flush(self):
+        """
+        Writes the held rows as one row group
+        """
+        if len(self.pending) == 1:
+            table = self.pending[0]
+        else:
+            import pyarrow as pa
+            # only the parts of one row group are joined, later dictionaries extend earlier ones so codes stay valid
+            table = pa.concat_tables(self.pending).unify_dictionaries().combine_chunks()
+        self.write_arrow(table)
+        self.pending = []
+        self.pending_rows = 0
+
+    def write_tsv(self, df):
+        """
+        Appends rows to a tab separated file, the header is written with the first rows
+        :param df: pd.DataFrame
+        """
+        header = self.output_file is None
+        if header:
+            self.output_file = open(self.path, 'w', newline='')
+        df.to_csv(self.output_file, header=header, index=False, quoting=3, quotechar='', escapechar=None, sep='\t')
+
+    def write_arrow(self, table):
+        """
+        Appends a record batch to a zstd compressed Parquet or Arrow IPC file
+        :param table: pyarrow.Table
+        """
+        if self.writer is None:
+            import pyarrow as pa
+            if self.file_format == 'parquet':
+                import pyarrow.parquet as pq
+                self.writer = pq.ParquetWriter(self.path, table.schema, compression='zstd')
+            else:
+                self.writer = pa.ipc.new_file(self.path, table.schema, options=pa.ipc.IpcWriteOptions(
+                    compression='zstd', emit_dictionary_deltas=True))
+        self.writer.write_table(table)
+
+    def arrow_table(self, df):
+        """
+        Converts a DF to Arrow, categorical columns are coded against dictionaries shared by all row groups
+        :param df: pd.DataFrame
+        :return: pyarrow.Table
+        """
+        import pyarrow as pa
+        columns = {}
+        for column in df.columns:
+            values = df[column]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                categories = values.cat.categories
+                dictionary = self.dictionaries.get(column, pd.Index([], dtype=object))
+                dictionary = dictionary.append(categories[dictionary.get_indexer(categories) < 0])
+                self.dictionaries[column] = dictionary
+                # trailing -1 keeps missing values missing
+                positions = np.append(dictionary.get_indexer(categories), -1).astype('int32')
+                codes = positions[values.cat.codes.values]
+                columns[column] = pa.DictionaryArray.from_arrays(pa.array(codes, mask=codes < 0),
+                                                                 pa.array(dictionary.values, pa.string()))
+            else:
+                columns[column] = pa.Array.from_pandas(values, type=pa.string() if values.dtype == object else None)
+        return pa.table(columns)
+
+    def close(self):
+        """
+        Finishes the file
+        """
+        # an empty table still gets a file with its schema
+        if self.pending_rows or (self.pending and self.writer is None):
+            with profile_stage(self.profile, 'write ' + self.name):
+                self.flush()
+        if self.writer is not None:
+            self.writer.close()
+        if self.output_file is not None:
+            self.output_file.close()
+
+
+class AnalyzerConfig:
+    """
+    Options of an analysis run shared by the CLI and library callers
+    """
+
+    def __init__(self, filter_lowqual=False, compare_dir=False, chunksize=None, workers=1, tokenizer='nltk',
+                 token_cache=None, compare_threads=COMPARE_THREADS):
+        self.filter_lowqual = filter_lowqual
+        self.compare_dir = compare_dir
+        self.workers = workers
+        # sharding needs chunks, default to 100000 passwords per chunk
+        self.chunksize = chunksize or (100000 if workers > 1 else None)
+        self.tokenizer = tokenizer
+        self.token_cache = token_cache
+        self.compare_threads = compare_threads
+
+
+class PasswordStats:
+    """
+    Running aggregates of analyzed passwords that can be folded chunk by chunk and merged
+    """
+
+    def __init__(self):
+        self.classes = self.empty_sums()
+        self.masks = self.empty_sums()
+        self.passwords = self.empty_sums()
+        self.tokens = pd.Series(dtype='int64')
+        self.hits = pd.Series(dtype='int64')
+        self.examples = pd.DataFrame({'Mask': pd.Series(dtype=object), 'Password': pd.Series(dtype=object)})
+        self.examples_per_mask = 3
+        # partial aggregates with their tier, fanout parts of a tier fold into one part of the next tier so every
+        # row is refolded only log(chunks) times
+        self.pending = []
+        self.fanout = 4
+
+    @staticmethod
+    def empty_sums():
+        """
+        Creates an empty table of per group counts and sums
+        :return: pd.DataFrame
+        """
+        return pd.DataFrame({'Count': pd.Series(dtype='int64'), 'Complexity': pd.Series(dtype='int64'),
+                             'Length': pd.Series(dtype='int64')})
+
+    @staticmethod
+    def sum_by(df, key):
+        """
+        Counts and sums complexity and length per group, weighted by password counts
+        :param df: analyzed pd.DataFrame
+        :param key: column to group by
+        :return: pd.DataFrame indexed by group
+        """
+        counts = df['Count'].astype('int64') if 'Count' in df else 1
+        df_sums = pd.DataFrame({key: df[key], 'Count': counts, 'Complexity': df['Complexity'].astype('int64') * counts,
+                                'Length': df['Length'].astype('int64') * counts}, index=df.index)
+        df_sums = df_sums.groupby(by=key, observed=False).sum()
+        if isinstance(df_sums.index, pd.CategoricalIndex):
+            df_sums.index = df_sums.index.astype(object)
+        return df_sums.astype('int64')
+
+    @staticmethod
+    def fold(parts, sort=True):
+        """
+        Adds aggregates together aligning on their index
+        :param parts: list of pd.DataFrame or pd.Series
+        :param sort: sort the index, otherwise keep first seen order
+        :return: sum of all parts
+        """
+        return pd.concat(parts).groupby(level=0, sort=sort).sum()
+
+    def update(self, analyzer):
+        """
+        Folds the passwords of an analyzed chunk into the running aggregates
+        :param analyzer: PasswordAnalyzer that has run analyze_passwords
+        """
+        df = analyzer.df
+        profile = analyzer.profile
+        chunk_stats = PasswordStats()
+        with profile_stage(profile, 'aggregate classes', len(df)):
+            chunk_stats.classes = self.sum_by(df, 'Class')
+        with profile_stage(profile, 'aggregate masks', len(df)):
+            chunk_stats.masks = self.sum_by(df, 'Mask')
+        with profile_stage(profile, 'aggregate passwords', len(df)):
+            chunk_stats.passwords = self.sum_by(df, 'Password')
+        with profile_stage(profile, 'tokenize', len(df)):
+            chunk_stats.tokens = analyzer.count_tokens()
+        with profile_stage(profile, 'aggregate hits', len(df)):
+            chunk_stats.hits = df[[i for i in df.columns if i.startswith('Is In ')]].multiply(
+                analyzer.password_counts(), axis=0).sum().astype('int64')
+        with profile_stage(profile, 'aggregate examples', len(df)):
+            chunk_stats.examples = analyzer.mask_examples(self.examples_per_mask)
+        self.merge(chunk_stats)
+
+    def example_index(self, masks=None):
+        """
+        Indexes the example passwords by mask so reports look each mask up once
+        :param masks: only index the examples of these masks, rare masks of a large sample are never printed
+        :return: dict of mask to list of passwords
+        """
+        self.compact()
+        df_examples = self.examples if masks is None else self.examples[self.examples['Mask'].isin(masks)]
+        # a plain loop, grouping into lists runs Python code per mask and there is a mask for most rare passwords
+        examples = {}
+        for mask, password in zip(df_examples['Mask'].to_numpy(), df_examples['Password'].to_numpy()):
+            examples.setdefault(mask, []).append(password)
+        return examples
+
+    def to_arrays(self):
+        """
+        Flattens the aggregates into plain arrays so they are saved without pickling pandas objects
+        :return: dict of np.ndarray
+        """
+        self.compact()
+        arrays = {}
+        for name, keys in [('classes', self.classes.index), ('masks', self.masks.index),
+                           ('passwords', self.passwords.index), ('tokens', self.tokens.index),
+                           ('hits', self.hits.index), ('example_masks', self.examples['Mask']),
+                           ('example_passwords', self.examples['Password'])]:
+            arrays[name + '_data'], arrays[name + '_offsets'] = pack_strings(keys)
+        for name in ['classes', 'masks', 'passwords']:
+            arrays[name + '_sums'] = getattr(self, name)[['Count', 'Complexity', 'Length']].to_numpy(dtype=np.int64)
+        arrays['tokens_counts'] = self.tokens.to_numpy(dtype=np.int64)
+        arrays['hits_counts'] = self.hits.to_numpy(dtype=np.int64)
+        return arrays
+
+    @staticmethod
+    def from_arrays(arrays):
+        """
+        Rebuilds aggregates flattened by to_arrays
+        :param arrays: mapping of np.ndarray
+        :return: PasswordStats
+        """
+        def strings(name):
+            return unpack_strings(arrays[name + '_data'], arrays[name + '_offsets'])
+
+        stats = PasswordStats()
+        for name, key in [('classes', 'Class'), ('masks', 'Mask'), ('passwords', 'Password')]:
+            setattr(stats, name, pd.DataFrame(arrays[name + '_sums'], columns=['Count', 'Complexity', 'Length'],
+                                              index=pd.Index(strings(name), name=key)))
+        stats.tokens = pd.Series(arrays['tokens_counts'], index=pd.Index(strings('tokens'), dtype=object))
+        stats.hits = pd.Series(arrays['hits_counts'], index=pd.Index(strings('hits'), dtype=object))
+        stats.examples = pd.DataFrame({'Mask': strings('example_masks'),
+                                       'Password': strings('example_passwords')})
+        return stats
+
+    def merge(self, other):
+        """
+        Merges the aggregates of another PasswordStats that covered later input
+        :param other: PasswordStats
+        """
+        other.compact()
+        self.pending.append((0, other))
+        # carry like a counter, only parts of similar size are folded together
+        while len(self.pending) >= self.fanout and len({tier for tier, _ in self.pending[-self.fanout:]}) == 1:
+            tier = self.pending[-1][0]
+            folded = PasswordStats()
+            folded.examples_per_mask = self.examples_per_mask
+            folded.fold_parts([part for _, part in self.pending[-self.fanout:]], sort=False)
+            del self.pending[-self.fanout:]
+            self.pending.append((tier + 1, folded))
+
+    def compact(self):
+        """
+        Folds all pending partial aggregates into this one
+        """
+        if not self.pending:
+            return
+        parts = [self] + [part for _, part in self.pending]
+        self.pending = []
+        self.fold_parts(parts)
+
+    def fold_parts(self, parts, sort=True):
+        """
+        Replaces the aggregates with the sum of parts that covered consecutive input
+        :param parts: list of compacted PasswordStats in input order
+        :param sort: sort the class, mask, password and token indexes, only the last fold needs to
+        """
+        self.classes = self.fold([i.classes for i in parts], sort)
+        self.masks = self.fold([i.masks for i in parts], sort)
+        self.passwords = self.fold([i.passwords for i in parts], sort)
+        self.tokens = self.fold([i.tokens for i in parts], sort)
+        self.hits = self.fold([i.hits for i in parts], sort=False)
+        # a password split across chunks is only one example
+        self.examples = pd.concat([i.examples for i in parts]).drop_duplicates().groupby('Mask', sort=False).head(
+            self.examples_per_mask)
+
+    @staticmethod
+    def mean_table(df_sums, key):
+        """
+        Turns per group sums into the per group means written to reports
+        :param df_sums: pd.DataFrame of counts and sums
+        :param key: name of the group column
+        :return: pd.DataFrame
+        """
+        return pd.DataFrame({key: df_sums.index, 'Count': df_sums['Count'].values,
+                             'Complexity': df_sums['Complexity'].values / df_sums['Count'].values,
+                             'Length': df_sums['Length'].values / df_sums['Count'].values})
+
+    @staticmethod
+    def token_table(token_counts):
+        """
+        Ranks token counts and drops tokens used only once
+        :param token_counts: pd.Series of counts indexed by token
+        :return: pd.DataFrame
+        """
+        token_counts = token_counts.sort_values(ascending=False)
+        df_tokens = pd.DataFrame({'Tokens': token_counts.index, 'Count': token_counts.values})
+        return df_tokens[df_tokens['Count'] > 1]
+
+    def aggregate(self):
+        """
+        Builds the token, class, mask and password tables
+        :return: tuple of pd.DataFrame
+        """
+        self.compact()
+        df_tokens = self.token_table(self.tokens)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            df_class_agg = self.mean_table(self.classes, 'Class')
+            df_mask_agg = self.mean_table(self.masks, 'Mask')
+            df_password_agg = self.mean_table(self.passwords, 'Password')
+
+        df_mask_agg = df_mask_agg.sort_values(by='Count', ascending=False).reset_index(drop=True)
+        # may need to comment the line below when dealing with small input
+        df_mask_agg = df_mask_agg[df_mask_agg['Count'] > 1]
+        df_password_agg = df_password_agg.sort_values(by='Count', ascending=False).reset_index(drop=True)
+        return df_tokens, df_class_agg, df_mask_agg, df_password_agg
+
+
+def mask_keyspaces(masks):
+    """
+    Counts the candidates of Hashcat masks in one pass over their packed charset letters
+    :param masks: array-like of masks such as ?u?l?l?d
+    :return: np.ndarray of float64 keyspaces, exact up to 2 ** 53
+    """
+    masks = np.asarray(masks, dtype=object)
+    sizes_table = np.ones(256)
+    for charset, size in CHARSET_SIZES.items():
+        sizes_table[ord(charset)] = size
+    lengths = np.fromiter(map(len, masks), dtype=np.int64, count=len(masks)) // 2
+    # every other byte of a mask is the charset letter following a ?
+    sizes = sizes_table[np.frombuffer(''.join(masks).encode('ascii'), dtype=np.uint8)[1::2]]
+    starts = np.cumsum(lengths) - lengths
+    keyspaces = np.ones(len(masks))
+    nonempty = lengths > 0
+    if nonempty.any():
+        keyspaces[nonempty] = np.multiply.reduceat(sizes, starts[nonempty])
+    return keyspaces
+
+
+def plan_masks(mask_counts, hash_rate, time_budget=None):
+    """
+    Orders masks by passwords cracked per candidate tried, the order that covers the most passwords soonest
+    :param mask_counts: pd.Series of password counts indexed by mask
+    :param hash_rate: hashes per second
+    :param time_budget: optional seconds the attack may run, masks that do not fit in the time left are skipped
+    :return: pd.DataFrame of Mask, Count, Keyspace, Efficiency and cumulative Coverage and Seconds
+
+    >>> list(plan_masks(pd.Series({'?l?a?l': 3, '?l?l': 1}), 1e9)['Coverage'])
+    [0.25]
+    >>> plan = plan_masks(pd.Series({'?d' * 12: 1000000, '?d' * 7: 1, '?d' * 5: 1}), 1e9, time_budget=100)
+    >>> list(plan['Mask'])
+    ['?d?d?d?d?d', '?d?d?d?d?d?d?d']
+    """
+    total = mask_counts.sum()
+    # an empty password has an empty mask that Hashcat cannot run, and ?a marks a character outside printable ASCII
+    # that no single Hashcat position matches, so both stay uncovered
+    mask_counts = mask_counts[(mask_counts.index != '') & ~mask_counts.index.str.contains('?a', regex=False)]
+    counts = mask_counts.values.astype(np.int64)
+    keyspaces = mask_keyspaces(mask_counts.index)
+    efficiency = counts / keyspaces
+    # stable, so masks tied on efficiency and count stay in mask order
+    order = np.lexsort((-counts, -efficiency))
+    df_plan = pd.DataFrame({'Mask': np.asarray(mask_counts.index, dtype=object)[order], 'Count': counts[order],
+                            'Keyspace': keyspaces[order], 'Efficiency': efficiency[order]})
+    if time_budget is not None:
+        # greedy by efficiency, one mask too large for the time left does not drop the cheaper masks after it
+        keep = np.zeros(len(df_plan), dtype=bool)
+        spent = 0.0
+        for i, seconds in enumerate((df_plan['Keyspace'].values / hash_rate).tolist()):
+            if spent + seconds <= time_budget:
+                keep[i] = True
+                spent += seconds
+        df_plan = df_plan[keep].reset_index(drop=True)
+    df_plan['Coverage'] = df_plan['Count'].cumsum() / total if total else 0.0
+    df_plan['Seconds'] = df_plan['Keyspace'].cumsum() / hash_rate
+    return df_plan
+
+
+def parse_quantity(text, units):
+    """
+    Reads a number with an optional unit suffix such as 10G or 2h
+    :param text: string to parse
+    :param units: dict of suffix to multiplier
+    :return: float
+    """
+    match = re.fullmatch(r'\s*([0-9.]+(?:e[0-9]+)?)\s*([a-zA-Z]?)\s*', str(text))
+    if not match or match.group(2) not in units:
+        raise argparse.ArgumentTypeError('expected a number followed by one of ' + ', '.join(filter(None, units)))
+    return float(match.group(1)) * units[match.group(2)]
+
+
+def parse_rate(text):
+    """
+    Reads a hash rate such as 25G
+    :param text: string to parse
+    :return: float hashes per second
+    """
+    return parse_quantity(text, RATE_UNITS)
+
+
+def parse_duration(text):
+    """
+    Reads a duration such as 90m or 2h
+    :param text: string to parse
+    :return: float seconds
+    """
+    return parse_quantity(text, DURATION_UNITS)
+
+
+def format_duration(seconds):
+    """
+    Formats seconds as days, hours, minutes and seconds, or years once that is unreadable
+    :param seconds: float
+    :return: str
+    """
+    if seconds >= 1000 * 365 * 86400:
+        return f'{seconds / (365.25 * 86400):.3g} years'
+    return str(datetime.timedelta(seconds=round(seconds)))
+
+
+def read_compare(compare_path, chunksize=None):
+    """
+    Reads a password list to compare against, memory mapped and decompressed in a stream when it ends in .gz, .bz2,
+    .xz, .zip or .zst (zstd needs the zstandard package)
+    :param compare_path: path of the list
+    :param chunksize: stream the list in chunks of this many lines
+    :return: pd.DataFrame or iterator of pd.DataFrame
+    """
+    return pd.read_table(compare_path, header=None, names=['Password'], dtype=str, encoding='ISO-8859-1',
+                         chunksize=chunksize, compression='infer', memory_map=True)
+
+
+def probe_chunks(uniques, compare_chunks):
+    """
+    Finds which distinct passwords are in any chunk of a compare list
+    :param uniques: pd.Index of distinct passwords
+    :param compare_chunks: iterable of pd.DataFrame to compare against
+    :return: np.ndarray of bool per distinct password
+    """
+    found = np.zeros(len(uniques), dtype=bool)
+    for compare_df in compare_chunks:
+        positions = uniques.get_indexer(compare_df['Password'])
+        found[positions[positions >= 0]] = True
+    return found
+
+
+def probe_index(uniques, compare_index):
+    """
+    Finds which distinct passwords have their hash in a prebuilt compare index
+    :param uniques: distinct passwords
+    :param compare_index: sorted np.ndarray of password hashes from load_compare_index
+    :return: np.ndarray of bool per distinct password
+    """
+    if not len(compare_index):
+        return np.zeros(len(uniques), dtype=bool)
+    probes = hash_passwords(uniques)
+    positions = np.minimum(np.searchsorted(compare_index, probes), len(compare_index) - 1)
+    return compare_index[positions] == probes
+
+
+def list_compare_files(compare_dir):
+    """
+    Lists the password lists of a compare directory, skipping their cached indexes
+    :param compare_dir: directory full of password lists
+    :return: list of file names
+    """
+    return [i for i in os.listdir(compare_dir) if not i.endswith((INDEX_SUFFIX, INDEX_SUFFIX + '.tmp'))]
+
+
+def hash_passwords(passwords):
+    """
+    Hashes passwords to 64 bit integers, the key of compare indexes
+    :param passwords: array-like of password strings
+    :return: np.ndarray of uint64
+    """
+    return pd.util.hash_array(np.asarray(passwords, dtype=object))
+
+
+def compare_hashes(compare_path):
+    """
+    Streams a compare list into a sorted array of its distinct password hashes
+    :param compare_path: path of the list
+    :return: np.ndarray of uint64
+    """
+    hashes = [np.unique(hash_passwords(df_compare['Password'].dropna()))
+              for df_compare in read_compare(compare_path, COMPARE_CHUNKSIZE)]
+    return np.unique(np.concatenate(hashes)) if hashes else np.zeros(0, dtype=np.uint64)
+
+
+def build_compare_index(compare_path):
+    """
+    Hashes a compare list into a sorted array of distinct password hashes saved next to it. The first two
+    entries record the size and modification time of the list so a changed list invalidates its index.
+    :param compare_path: path of the list
+    :return: path of the index
+    """
+    stat = os.stat(compare_path)
+    index = np.concatenate([np.array([stat.st_size, stat.st_mtime_ns], dtype=np.uint64), compare_hashes(compare_path)])
+
+    index_path = compare_path + INDEX_SUFFIX
+    with open(index_path + '.tmp', 'wb') as index_file:
+        np.save(index_file, index)
+    os.replace(index_path + '.tmp', index_path)
+    return index_path
+
+
+def load_compare_index(compare_path):
+    """
+    Memory maps the index of a compare list when it is still current
+    :param compare_path: path of the list
+    :return: sorted np.ndarray of password hashes, or None without a current index
+    """
+    index_path = compare_path + INDEX_SUFFIX
+    if not os.path.isfile(index_path):
+        return None
+    stat = os.stat(compare_path)
+    index = np.load(index_path, mmap_mode='r')
+    if len(index) < 2 or index[0] != stat.st_size or index[1] != stat.st_mtime_ns:
+        return None
+    return index[2:]
+
+
+def build_compare_indexes(compare_dir):
+    """
+    Builds or refreshes the index of every list in a compare directory
+    :param compare_dir: directory full of password lists
+    :return: list of indexed file names
+    """
+    indexed = []
+    for i in list_compare_files(compare_dir):
+        compare_path = os.path.join(compare_dir, i)
+        if os.path.isfile(compare_path) and load_compare_index(compare_path) is None:
+            build_compare_index(compare_path)
+            indexed.append(i)
+    return indexed
+
+
+def read_passwords(source, chunksize=None):
+    """
+    Reads a list of passwords, one per line
+    :param source: path or file object
+    :param chunksize: stream the list in chunks of this many passwords
+    :return: iterator of pd.DataFrame, the file is opened at once but read as the chunks are taken
+    """
+    reader = pd.read_table(source, header=None, names=['Password'], quoting=3, on_bad_lines='skip',
+                           chunksize=chunksize, iterator=True)
+    return reader if chunksize else read_whole(reader)
+
+
+def read_whole(reader):
+    """
+    Reads a whole list when its only chunk is taken, so the read is timed with the chunks of chunked lists
+    :param reader: pandas TextFileReader
+    :return: generator of one pd.DataFrame
+    """
+    with reader:
+        yield reader.read()
+
+
+def analyze_chunk(df, config, compare_cache=None, keep_rows=False, profile=False):
+    """
+    Analyzes one chunk of passwords
+    :param df: pd.DataFrame with a Password column
+    :param config: AnalyzerConfig
+    :param compare_cache: optional dict keeping the hashes of compare lists for the following chunks instead of
+        streaming the lists for every chunk
+    :param keep_rows: also return the analyzed table with one row per input password
+    :param profile: also return a StageProfile of the chunk
+    :return: tuple of PasswordStats, pd.DataFrame or None and StageProfile or None
+    """
+    df['Password'] = df['Password'].astype(str)
+    token_cache = TokenCache(config.token_cache, config.tokenizer) if config.token_cache else None
+    chunk_profile = StageProfile() if profile else None
+    analyzer = PasswordAnalyzer(df, config.filter_lowqual, token_cache, config.tokenizer, chunk_profile)
+    analyzer.analyze_passwords()
+    analyzer.lookup_directory(config.compare_dir, compare_cache, config.compare_threads)
+    stats = PasswordStats()
+    stats.update(analyzer)
+    if token_cache:
+        token_cache.close()
+    rows = None
+    if keep_rows:
+        with profile_stage(chunk_profile, 'expand rows', len(df)):
+            rows = analyzer.row_table()
+    return stats, rows, chunk_profile
+
+
+def start_worker(cache_compare):
+    """
+    Gives a process of an analyze_chunks pool its own compare cache, freed with the pool
+    :param cache_compare: keep the hashes of compare lists between chunks
+    """
+    global worker_compare_cache
+    worker_compare_cache = {} if cache_compare else None
+
+
+def analyze_worker_chunk(df, config, keep_rows=False, profile=False):
+    """
+    Analyzes one chunk in a worker process with the compare cache of that process
+    :param df: pd.DataFrame with a Password column
+    :param config: AnalyzerConfig
+    :param keep_rows: also return the analyzed table with one row per input password
+    :param profile: also return a StageProfile of the chunk
+    :return: tuple of PasswordStats, pd.DataFrame or None and StageProfile or None
+    """
+    return analyze_chunk(df, config, worker_compare_cache, keep_rows, profile)
+
+
+def analyze_chunks(chunks, config, row_writer=None, profile=None):
+    """
+    Analyzes chunks of passwords across a process pool and merges their aggregates in input order
+    :param chunks: iterable of pd.DataFrame
+    :param config: AnalyzerConfig
+    :param row_writer: optional TableWriter receiving the analyzed rows of every chunk in input order
+    :param profile: optional StageProfile collecting the stages of every chunk
+    :return: PasswordStats
+    """
+    stats = PasswordStats()
+    cache_compare = bool(config.chunksize)
+    keep_rows = row_writer is not None
+    if profile is not None:
+        chunks = profile.iterate('read', chunks)
+
+    def collect(result):
+        chunk_stats, rows, chunk_profile = result
+        with profile_stage(profile, 'merge'):
+            stats.merge(chunk_stats)
+        if chunk_profile is not None:
+            profile.merge(chunk_profile)
+        if keep_rows:
+            row_writer.write(rows)
+
+    if config.workers <= 1:
+        # the hashes of the compare lists live as long as this call
+        compare_cache = {} if cache_compare else None
+        for df in chunks:
+            collect(analyze_chunk(df, config, compare_cache, keep_rows, profile is not None))
+        return stats
+
+    with ProcessPoolExecutor(max_workers=config.workers, initializer=start_worker,
+                             initargs=(cache_compare,)) as executor:
+        # keep a bounded number of chunks in flight so input is not read ahead without limit
+        pending = deque()
+        for df in chunks:
+            pending.append(executor.submit(analyze_worker_chunk, df, config, keep_rows, profile is not None))
+            if len(pending) >= config.workers * 2:
+                collect(pending.popleft().result())
+        while pending:
+            collect(pending.popleft().result())
+    return stats
+
+
+def analyze(passwords, config=None, row_writer=None, profile=None):
+    """
+    Analyzes passwords in process, the entry point for library callers
+    :param passwords: path or file of a password list, pd.DataFrame with a Password column or iterable of strings
+    :param config: AnalyzerConfig, defaults to AnalyzerConfig()
+    :param row_writer: optional TableWriter receiving the full per password table
+    :param profile: optional StageProfile timing each stage
+    :return: PasswordReport
+    """
+    if config is None:
+        config = AnalyzerConfig()
+    if isinstance(passwords, (str, os.PathLike)) or hasattr(passwords, 'read'):
+        chunks = read_passwords(passwords, config.chunksize)
+    else:
+        if not isinstance(passwords, pd.DataFrame):
+            passwords = pd.DataFrame({'Password': list(passwords)})
+        chunksize = config.chunksize or max(len(passwords), 1)
+        chunks = (passwords[['Password']].iloc[i:i + chunksize].copy() for i in range(0, len(passwords), chunksize))
+    stats = analyze_chunks(chunks, config, row_writer, profile)
+    with profile_stage(profile, 'report'):
+        return PasswordReport(stats, config.filter_lowqual)
+
+
+def state_fingerprint(config):
+    """
+    Describes the options that change aggregates, a state file is only valid for the same options
+    :param config: AnalyzerConfig
+    :return: dict
+    """
+    return {'filter_lowqual': bool(config.filter_lowqual), 'tokenizer': TOKENIZER_RULES[config.tokenizer],
+            'compare_files': sorted(list_compare_files(config.compare_dir)) if config.compare_dir else []}
+
+
+def tail_digest(input_file, offset):
+    """
+    Hashes the bytes just before an offset to notice a list that was rewritten instead of appended to
+    :param input_file: binary file object
+    :param offset: byte offset
+    :return: str
+    """
+    start = max(offset - 4096, 0)
+    input_file.seek(start)
+    return hashlib.sha256(input_file.read(offset - start)).hexdigest()
+
+
+def complete_lines_end(input_file, start, end):
+    """
+    Finds the offset just past the last newline between two offsets, a final line without one may still be growing
+    :param input_file: binary file object
+    :param start: byte offset to search from
+    :param end: byte offset to search back from
+    :return: int, start when there is no complete line
+    """
+    position = end
+    while position > start:
+        block_start = max(start, position - (1 << 16))
+        input_file.seek(block_start)
+        newline = input_file.read(position - block_start).rfind(b'\n')
+        if newline >= 0:
+            return block_start + newline + 1
+        position = block_start
+    return start
+
+
+class LimitedReader(io.RawIOBase):
+    """
+    Reads a binary file from its current position up to a byte limit, so a list is parsed only up to an offset
+    """
+
+    def __init__(self, raw, limit):
+        super().__init__()
+        self.raw = raw
+        self.remaining = limit
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.raw.read(min(len(buffer), self.remaining))
+        buffer[:len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
+
+def analyze_incremental(source, state_path, config=None, profile=None):
+    """
+    Analyzes only the passwords added since the state file was saved, then saves the updated state
+    :param source: path or binary file of a growing password list, any other file is read as new passwords only
+    :param state_path: state file, created when missing
+    :param config: AnalyzerConfig, defaults to AnalyzerConfig()
+    :param profile: optional StageProfile timing each stage
+    :return: PasswordReport
+    """
+    if config is None:
+        config = AnalyzerConfig()
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as input_file:
+            return analyze_incremental(input_file, state_path, config, profile)
+
+    stats, offset, digest = PasswordStats(), 0, None
+    fingerprint = state_fingerprint(config)
+    if os.path.isfile(state_path):
+        with profile_stage(profile, 'load state'):
+            try:
+                with np.load(state_path, allow_pickle=False) as state_file:
+                    arrays = dict(state_file)
+                header = json.loads(arrays.pop('header').tobytes().decode('utf-8'))
+            except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+                raise ValueError('State file ' + str(state_path) + ' is not a state of this pwdstat version') from None
+            if header.get('version') != STATE_VERSION or header.get('fingerprint') != fingerprint:
+                raise ValueError('State file ' + str(state_path) + ' was saved with different options')
+            stats = PasswordStats.from_arrays(arrays)
+        offset, digest = header['offset'], header['digest']
+
+    if source.seekable() and isinstance(source.read(0), bytes):
+        size = os.fstat(source.fileno()).st_size
+        if offset and (size < offset or tail_digest(source, offset) != digest):
+            # the list was rewritten rather than appended to so start over
+            stats, offset = PasswordStats(), 0
+        # a last line without a newline is left for the next run, the rest of it may not be written yet
+        end = complete_lines_end(source, offset, size)
+        source.seek(offset)
+        if end > offset:
+            chunks = read_passwords(io.BufferedReader(LimitedReader(source, end - offset)), config.chunksize)
+            stats.merge(analyze_chunks(chunks, config, profile=profile))
+        offset = end
+        digest = tail_digest(source, offset)
+    else:
+        chunks = read_passwords(source, config.chunksize)
+        stats.merge(analyze_chunks(chunks, config, profile=profile))
+
+    with profile_stage(profile, 'save state'):
+        stats.compact()
+        header = {'version': STATE_VERSION, 'fingerprint': fingerprint, 'offset': offset, 'digest': digest}
+        # plain arrays and a JSON header, readable by any pandas version and by library callers and the CLI alike
+        with open(str(state_path) + '.tmp', 'wb') as state_file:
+            np.savez(state_file, header=np.frombuffer(json.dumps(header).encode('utf-8'), dtype=np.uint8),
+                     **stats.to_arrays())
+        os.replace(str(state_path) + '.tmp', state_path)
+    with profile_stage(profile, 'report'):
+        return PasswordReport(stats, config.filter_lowqual)
+
 
 if __name__ == '__main__':
     # colorama
@@ -432,17 +1716,43 @@ if __name__ == '__main__':
                         help='Directory of lists to compare against.')
     parser.add_argument("-o", "--output", action="store", default=False,
                         help="Prints CSV files to directory. The default is cwd.")
+    parser.add_argument("--format", action="store", choices=OUTPUT_FORMATS, default='tsv',
+                        help="Format of output files, parquet and arrow are compressed columnar files.")
     parser.add_argument("-f", "--filter", action="store_true", default=False,
                         help="Filter subpar from results and bottom 0.01 percent of masks and tokens.")
     parser.add_argument("-q", "--quiet", action="store_true", default=False,
                         help="Hides banner")
     parser.add_argument("-v", "--viz", action="store_true", default=False,
                         help="Creates visuals of data in output directory.")
+    parser.add_argument("--chunksize", action="store", type=int, default=None,
+                        help="Streams the input in chunks of this many passwords to bound memory.")
+    parser.add_argument("--workers", action="store", type=int, default=1,
+                        help="Shards the input across this many processes.")
+    parser.add_argument("--tokenizer", action="store", choices=TOKENIZERS, default='nltk',
+                        help="Tokenizer backend, fast and leet split runs of letters, digits and symbols.")
+    parser.add_argument("--token-cache", action="store", default=None,
+                        help="File caching password tokens between runs.")
+    parser.add_argument("--build-index", action="store_true", default=False,
+                        help="Builds cached indexes for the compare directory then exits.")
+    parser.add_argument("--state", action="store", default=None,
+                        help="State file to resume from, only passwords appended to the input since are analyzed.")
+    parser.add_argument("--hcmask", action="store", default=None,
+                        help="Writes the masks ordered by passwords cracked per candidate to this .hcmask file.")
+    parser.add_argument("--hash-rate", action="store", type=parse_rate, default=1e9,
+                        help="Hashes per second used to time the --hcmask masks, takes k, M, G and T suffixes.")
+    parser.add_argument("--time-budget", action="store", type=parse_duration, default=None,
+                        help="Keeps only the --hcmask masks that finish within this time, takes s, m, h and d suffixes.")
+    parser.add_argument("--compare-threads", action="store", type=int, default=COMPARE_THREADS,
+                        help="Compare lists read and probed at once.")
+    parser.add_argument("--profile", action="store_true", default=False,
+                        help="Prints wall time, CPU time, rows/sec and memory growth of each stage.")
+    parser.add_argument("--profile-output", action="store", default=None,
+                        help="Profiles and saves the stages to a .json file or a cProfile pstats file.")
 
-    dep_check()
     pd.set_option('mode.chained_assignment', None)
     args = parser.parse_args()
-    stemmer = PorterStemmer()
+    if args.tokenizer == 'nltk':
+        dep_check()
 
     if args.output:
         if args.output == '-':
@@ -453,17 +1763,69 @@ if __name__ == '__main__':
 
     if not sys.stdin.isatty() and not args.input:
         args.input = sys.stdin
+    if args.build_index:
+        if not args.compare:
+            print('No compare directory given')
+            exit()
+        for i in build_compare_indexes(args.compare):
+            message('Indexed ' + message(i, word=True), stat=True)
+        exit()
+    config = AnalyzerConfig(args.filter, args.compare, args.chunksize, args.workers, args.tokenizer, args.token_cache,
+                            args.compare_threads)
+    profile = StageProfile() if args.profile or args.profile_output else None
+    profiler = None
+    if args.profile_output and not args.profile_output.endswith('.json'):
+        # cProfile only sees the main process, worker processes show up as waiting on results
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
 
     try:
         if not args.quiet:
             message('', banner=True)
-        df = pd.read_table(args.input, header=None, names=['Password'], quoting=3, on_bad_lines='skip')
-        df['Password'] = df['Password'].astype(str)
+        if args.state:
+            input_file = args.input.buffer if args.input is sys.stdin else open(args.input, 'rb')
+        else:
+            chunks = read_passwords(args.input, config.chunksize)
     except FileNotFoundError:
         print('No input file found')
         exit()
 
-    pwdAnalyzer = PasswordAnalyzer(df, args.filter)
-    pwdAnalyzer.analyze_passwords()
-    pwdAnalyzer.lookup_directory(args.compare)
-    pwdAnalyzer.report()
+    if args.state:
+        try:
+            pwdReport = analyze_incremental(input_file, args.state, config, profile)
+        except ValueError as error:
+            print(error)
+            exit()
+    else:
+        # the per password table is streamed out while chunks are analyzed
+        row_writer = TableWriter(args.output, 'passwords', args.format, profile) if args.output else None
+        stats = analyze_chunks(chunks, config, row_writer, profile)
+        if row_writer:
+            row_writer.close()
+        with profile_stage(profile, 'report'):
+            pwdReport = PasswordReport(stats, config.filter_lowqual)
+    with profile_stage(profile, 'print'):
+        pwdReport.print_report()
+    if args.output:
+        pwdReport.write_tables(args.output, args.format, profile)
+    if args.viz:
+        with profile_stage(profile, 'write charts'):
+            pwdReport.write_viz(args.output)
+    if args.hcmask:
+        with profile_stage(profile, 'mask plan', len(pwdReport.mask_counts)):
+            plan = pwdReport.mask_plan(args.hash_rate, args.time_budget)
+        pwdReport.print_plan(plan, args.hash_rate)
+        pwdReport.write_hcmask(plan, args.hcmask)
+        if args.output:
+            plan_writer = TableWriter(args.output, 'mask_plan', args.format, profile)
+            plan_writer.write(plan)
+            plan_writer.close()
+
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(args.profile_output)
+    if profile:
+        profile.print_summary()
+        if args.profile_output and args.profile_output.endswith('.json'):
+            profile.write_json(args.profile_output)